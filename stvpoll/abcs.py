@@ -6,15 +6,20 @@ from contextlib import suppress
 from decimal import Decimal
 from functools import cached_property
 
-from typing import Iterable, Callable, Iterator
+from typing import Iterable, Iterator
 from typing_extensions import deprecated
 
+from .arithmetic import Arithmetic, DecimalArithmetic
+from .base import get_bulk_exclusion
+from .ballots import PreferenceBallot, rounding_method
 from .exceptions import (
     CandidateDoesNotExist,
     IncompleteResult,
     STVException,
 )
+from .piles import BallotPiles
 from .result import ElectionResult
+from .store import BallotProfile, BallotStore
 from .tiebreak_strategies import (
     TiebreakStrategy,
     TiebreakHistory,
@@ -34,58 +39,9 @@ from .types import (
 from .quotas import Quota
 
 
-def rounding_method(value: Decimal) -> Decimal:
-    return round(value, 5).normalize()
-
-
-class PreferenceBallot(list[Candidate]):
-    def __init__(
-        self,
-        preferences: Iterable[Candidate],
-        count: int,
-        rounding: Callable[[Decimal], Decimal] = rounding_method,
-    ) -> None:
-        super().__init__(preferences)
-        self.count = count
-        self.multiplier = Decimal(1)
-        self.round = rounding
-
-    @property
-    def value(self) -> Decimal:
-        return self.multiplier * self.count
-
-    def decrease_value(self, multiplier: Decimal) -> None:
-        self.multiplier = self.round(self.multiplier * multiplier)
-
-    def get_next_preference(
-        self, standing: Candidates | set[Candidate]
-    ) -> Candidate | None:
-        """
-        Get next candidate from preferences, from a list of standing candidates.
-        >>> PreferenceBallot(('A', 'B', 'C'), 1).get_next_preference(('B', 'C'))
-        'B'
-        >>> PreferenceBallot(('A', 'B', 'C'), 1).get_next_preference(('D',))
-        """
-        return next((p for p in self if p in standing), None)
-
-    def is_current_candidate(
-        self, candidate: Candidate, standing: Candidates | set[Candidate]
-    ) -> bool:
-        """
-        Assuming list of standing candidates, is candidate current preference on ballot?
-        >>> PreferenceBallot(('A', 'B', 'C'), 1).is_current_candidate('A', ('B', 'C'))
-        False
-        >>> PreferenceBallot(('A', 'B', 'C'), 1).is_current_candidate('B', ('B', 'C'))
-        True
-        """
-        return self.get_next_preference(standing) == candidate
-
-    def __repr__(self) -> str:
-        return f"PreferenceBallot([{','.join(map(str, self))}], {self.count})"
-
-
 class STVPollBase(ABC):
-    ballots: list[PreferenceBallot]
+    ballots: list[PreferenceBallot] | BallotStore
+    piles: BallotPiles
     candidates: Candidates
     seats: int
     tiebreakers: list[TiebreakStrategy]
@@ -102,19 +58,31 @@ class STVPollBase(ABC):
         quota: Quota | None = None,
         random_in_tiebreaks: bool = True,
         pedantic_order: bool = False,
+        arithmetic: Arithmetic | None = None,
+        merge_interval: int = 0,
+        compact_ballots: bool = False,
+        bulk_exclusion: bool = False,
     ):
         candidates = tuple(candidates)
         self.candidates = tuple(random.sample(candidates, len(candidates)))
-        self.ballots = []
         self._quota_function = quota
         self.seats = seats
         self.pedantic_order = pedantic_order
+        self.arithmetic = arithmetic or DecimalArithmetic(self.round)
+        # Keep ballots in arrays, instead of one object per ballot
+        self.ballots = (
+            BallotStore(candidates, self.arithmetic) if compact_ballots else []
+        )
+        # Merge equivalent ballots each time this many candidates have left
+        self.merge_interval = merge_interval
+        self.bulk_exclusion = bulk_exclusion
         if len(self.candidates) < self.seats:
             raise STVException("Not enough candidates to fill seats")
         self.tiebreakers = [TiebreakHistory()]
         if random_in_tiebreaks:
             self.tiebreakers.append(TiebreakRandom(candidates))
         self.result = ElectionResult(candidates=self.candidates, seats=self.seats)
+        self.set_standing()
 
     @cached_property
     def quota(self) -> int:
@@ -129,10 +97,22 @@ class STVPollBase(ABC):
         ballot = tuple(ballot)
         if set(ballot).difference(self.candidates):
             raise CandidateDoesNotExist
-        if ballot:
-            self.ballots.append(PreferenceBallot(ballot, num, self.round))
-        else:
+        if not ballot:
             self.result.empty_ballot_count += num
+        elif isinstance(self.ballots, BallotStore):
+            self.ballots.add(ballot, num)
+        else:
+            self.ballots.append(self.arithmetic.ballot(ballot, num))
+
+    def load_profile(self, profile: BallotProfile) -> None:
+        """
+        Count ballots of a shared profile, instead of added ballots.
+        Each count has its own weights, so the profile may be counted by other polls.
+        """
+        if set(profile.candidates).difference(self.candidates):
+            raise CandidateDoesNotExist
+        self.ballots = BallotStore(profile, self.arithmetic)
+        self.result.empty_ballot_count = profile.empty_ballot_count
 
     def get_current_votes(self, candidate: Candidate) -> Decimal:
         return self.current_votes.get(candidate) or Decimal(0)
@@ -172,7 +152,7 @@ class STVPollBase(ABC):
             candidates = (candidates,)
 
         transfers, exhausted, self.current_votes = self.transfer_strategy(
-            ballots=self.ballots,
+            ballots=self.piles,
             vote_count=self.current_votes,
             transfers=candidates,
             standing=self.standing_candidates,
@@ -189,15 +169,24 @@ class STVPollBase(ABC):
             }
         )
 
+    def set_standing(self) -> None:
+        """Standing candidates from candidates, after that kept up to date by select()."""
+        self._standing_candidates = tuple(
+            filter(self.result.still_standing, self.candidates)
+        )
+        self.standing = set(self._standing_candidates)
+
     def initial_votes(self) -> None:
+        # Candidates may have been changed after init
+        self.set_standing()
         standing = self.standing_candidates
-
-        def get_initial_votes(candidate: Candidate):
-            return candidate, sum(
-                (b.value for b in self.ballots if b[0] == candidate), start=Decimal(0)
-            )
-
-        self.current_votes = dict(map(get_initial_votes, standing))
+        ballots = self.ballots
+        if isinstance(ballots, BallotStore):
+            # Fresh weights, keeping stored ballots as they were
+            ballots = ballots.new_count()
+        self.piles = self.arithmetic.piles(ballots, standing)
+        self.current_votes = self.piles.get_votes(standing)
+        self._merged_standing = len(standing)
         self.result.transfer_log.append(
             {
                 "transfers": None,
@@ -214,7 +203,7 @@ class STVPollBase(ABC):
 
     @property
     def standing_candidates(self) -> Candidates:
-        return tuple(filter(self.result.still_standing, self.candidates))
+        return self._standing_candidates
 
     @property
     def seats_to_fill(self) -> int:
@@ -252,15 +241,37 @@ class STVPollBase(ABC):
                 if self.pedantic_order
                 else self._get_sorted_elect_order(candidates)
             )
-        self.result.select(
-            candidates, self.current_votes, method, CandidateStatus.Elected
-        )
+        self.select(candidates, method, CandidateStatus.Elected)
         return candidates
 
     def exclude(self, candidate: Candidate, method: SelectionMethod) -> None:
-        self.result.select(
-            candidate, self.current_votes, method, CandidateStatus.Excluded
+        self.select((candidate,), method, CandidateStatus.Excluded)
+
+    def select(
+        self, candidates: Candidates, method: SelectionMethod, status: CandidateStatus
+    ) -> None:
+        """Record selected candidates in result, and remove them from standing."""
+        self.result.select(candidates, self.current_votes, method, status)
+        self.standing.difference_update(candidates)
+        self._standing_candidates = tuple(
+            filter(self.standing.__contains__, self._standing_candidates)
+        )
+
+    def bulk_exclude(self) -> bool:
+        """
+        Exclude all hopeless lowest candidates at once and transfer their votes, if enabled.
+        Each candidate is recorded as excluded, in order. See get_bulk_exclusion.
+        """
+        if not self.bulk_exclusion:
+            return False
+        candidates = get_bulk_exclusion(
+            self.current_votes, self.quota, max(self.seats_to_fill, 1)
         )
+        for candidate in candidates:
+            self.exclude(candidate, SelectionMethod.BulkExclusion)
+        if candidates:
+            self.transfer_votes(candidates)
+        return bool(candidates)
 
     def calculate(self) -> ElectionResult:
         self.initial_votes()
@@ -271,6 +282,19 @@ class STVPollBase(ABC):
     def do_rounds(self) -> None:
         while self.seats_to_fill:
             self.calculate_round()
+            self.merge_ballots()
+
+    def merge_ballots(self) -> None:
+        """Merge equivalent ballots, if enough candidates have left since last merge."""
+        standing = len(self.standing_candidates)
+        if (
+            self.merge_interval
+            and self._merged_standing - standing >= self.merge_interval
+        ):
+            ballot_count = len(self.piles)
+            self.piles.merge()
+            self.result.log_ballot_merge(ballot_count, len(self.piles))
+            self._merged_standing = standing
 
     @abstractmethod
     def calculate_round(self) -> None: ...
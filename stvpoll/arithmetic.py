@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+from decimal import Decimal, ROUND_HALF_EVEN, getcontext
+from typing import Any, Callable, Iterable, Protocol
+
+from stvpoll.ballots import PreferenceBallot, rounding_method
+from stvpoll.exceptions import STVException
+from stvpoll.piles import BallotPiles
+from stvpoll.types import Candidate
+
+
+class Arithmetic(Protocol):
+    """
+    Arithmetic for ballot weights. Transfer strategies sum ballot weights in the
+    representation of the arithmetic, while vote counts are always Decimal.
+    """
+
+    zero: Any
+
+    def ballot(
+        self, preferences: Iterable[Candidate], count: int
+    ) -> PreferenceBallot:  # pragma: no coverage
+        ...
+
+    def piles(
+        self, ballots: Iterable[PreferenceBallot], standing: Iterable[Candidate]
+    ) -> BallotPiles:  # pragma: no coverage
+        """Index ballots for counting and transfer strategies."""
+        ...
+
+    def get_transfer_quota(
+        self, votes: Decimal, quota: int
+    ) -> Any:  # pragma: no coverage
+        ...
+
+    def to_decimal(self, weight: Any) -> Decimal:  # pragma: no coverage
+        ...
+
+
+class DecimalArithmetic:
+    """
+    Default arithmetic, with Decimal ballot multipliers rounded after each transfer.
+    Ballots are indexed for counting by index, BallotPiles or BallotTrie.
+    """
+
+    zero = Decimal(0)
+
+    def __init__(
+        self,
+        rounding: Callable[[Decimal], Decimal] = rounding_method,
+        index: type[BallotPiles] = BallotPiles,
+    ) -> None:
+        self.rounding = rounding
+        self.index = index
+
+    def ballot(self, preferences: Iterable[Candidate], count: int) -> PreferenceBallot:
+        return PreferenceBallot(preferences, count, self.rounding)
+
+    def piles(
+        self, ballots: Iterable[PreferenceBallot], standing: Iterable[Candidate]
+    ) -> BallotPiles:
+        return self.index(ballots, standing, self)
+
+    @staticmethod
+    def get_transfer_quota(votes: Decimal, quota: int) -> Decimal:
+        return (votes - quota) / votes
+
+    @staticmethod
+    def to_decimal(weight: Decimal) -> Decimal:
+        return weight
+
+
+def strip_zeros(value: Decimal) -> Decimal:
+    """
+    Value without trailing zeros after the decimal point, like rounding_method gives,
+    but whole numbers without exponent.
+    >>> strip_zeros(Decimal('0.50000')), strip_zeros(Decimal('60.00000'))
+    (Decimal('0.5'), Decimal('60'))
+    """
+    if value == value.to_integral_value():
+        return value.quantize(1)
+    return value.normalize()
+
+
+def _round_half_even(numerator: int, denominator: int) -> int:
+    """
+    >>> _round_half_even(25, 10), _round_half_even(35, 10), _round_half_even(36, 10)
+    (2, 4, 4)
+    """
+    quotient, remainder = divmod(numerator, denominator)
+    remainder += remainder
+    if remainder > denominator or (remainder == denominator and quotient & 1):
+        return quotient + 1
+    return quotient
+
+
+class FixedPointQuota:
+    """
+    Transfer quota for FixedPoint ballots.
+    Multiplies integer units exactly as Decimal would multiply and round the multiplier:
+    product rounded to context precision, then to fixed point precision.
+    """
+
+    __slots__ = (
+        "coefficient",
+        "exponent",
+        "divisor",
+        "low",
+        "high",
+        "precision",
+        "context_precision",
+    )
+
+    def __init__(self, transfer_quota: Decimal, precision: int) -> None:
+        context = getcontext()
+        if context.rounding != ROUND_HALF_EVEN:  # pragma: no coverage
+            raise STVException("Fixed point arithmetic requires ROUND_HALF_EVEN")
+        sign, digits, exponent = transfer_quota.as_tuple()
+        if sign:
+            raise STVException(f"Negative transfer quota {transfer_quota}")
+        self.coefficient = int("".join(map(str, digits)))
+        self.exponent = exponent
+        self.precision = precision
+        self.context_precision = context.prec
+        if exponent >= 0:
+            self.coefficient *= 10**exponent
+            self.divisor = 1
+        else:
+            self.divisor = 10**-exponent
+        # Rounding the product to context precision moves it at most half of this margin,
+        # so only remainders close to a half unit need exact treatment.
+        excess = len(str(self.coefficient * 10**precision)) - context.prec
+        margin = 10**excess if excess > 0 else 0
+        self.low = self.divisor - margin
+        self.high = self.divisor + margin
+
+    def apply(self, units: int) -> int:
+        quotient, remainder = divmod(units * self.coefficient, self.divisor)
+        remainder += remainder
+        if remainder > self.high:
+            return quotient + 1
+        if remainder < self.low:
+            return quotient
+        return self._apply_exact(units)
+
+    def _apply_exact(self, units: int) -> int:
+        product = units * self.coefficient
+        exponent = min(self.exponent, 0) - self.precision
+        if (excess := len(str(product)) - self.context_precision) > 0:
+            product = _round_half_even(product, 10**excess)
+            exponent += excess
+        if exponent >= -self.precision:
+            return product * 10 ** (exponent + self.precision)
+        return _round_half_even(product, 10 ** (-self.precision - exponent))
+
+
+class FixedPointBallot(PreferenceBallot):
+    """
+    PreferenceBallot with multiplier kept as integer units of the FixedPoint arithmetic.
+    Multiplier and value are still reported as Decimal.
+    Transfer strategies need ballots in BallotPiles, to know their arithmetic.
+    """
+
+    units: int
+
+    def __init__(
+        self,
+        preferences: Iterable[Candidate],
+        count: int,
+        arithmetic: FixedPoint,
+    ) -> None:
+        # Same as PreferenceBallot, without creating a Decimal multiplier
+        list.__init__(self, preferences)
+        self.count = count
+        self.units = arithmetic.unit
+        self.arithmetic = arithmetic
+        self.position = 0
+
+    @property
+    def multiplier(self) -> Decimal:
+        return strip_zeros(self.arithmetic.to_decimal(self.units))
+
+    @multiplier.setter
+    def multiplier(self, value: Decimal) -> None:
+        self.units = int(value.scaleb(self.arithmetic.precision).to_integral_value())
+
+    @property
+    def value(self) -> Decimal:
+        return self.multiplier * self.count
+
+    @property
+    def weight(self) -> int:
+        return self.units * self.count
+
+    def decrease_value(self, multiplier: FixedPointQuota) -> None:
+        self.units = multiplier.apply(self.units)
+
+
+class FixedPoint:
+    """
+    Integer fixed point arithmetic, keeping ballot multipliers as integer units.
+    Results are identical to DecimalArithmetic rounding to the same number of decimals.
+    Ballots are indexed for counting by index, BallotPiles or BallotTrie.
+    >>> arithmetic = FixedPoint()
+    >>> ballot = arithmetic.ballot(('A', 'B'), 3)
+    >>> ballot.decrease_value(arithmetic.get_transfer_quota(Decimal(7), 4))
+    >>> ballot.units, ballot.weight, ballot.value
+    (42857, 128571, Decimal('1.28571'))
+    """
+
+    zero = 0
+
+    def __init__(
+        self, precision: int = 5, index: type[BallotPiles] = BallotPiles
+    ) -> None:
+        self.precision = precision
+        self.index = index
+        self.unit = 10**precision
+
+    def ballot(self, preferences: Iterable[Candidate], count: int) -> FixedPointBallot:
+        return FixedPointBallot(preferences, count, self)
+
+    def piles(
+        self, ballots: Iterable[FixedPointBallot], standing: Iterable[Candidate]
+    ) -> BallotPiles:
+        return self.index(ballots, standing, self)
+
+    def get_transfer_quota(self, votes: Decimal, quota: int) -> FixedPointQuota:
+        return FixedPointQuota((votes - quota) / votes, self.precision)
+
+    def to_decimal(self, weight: int) -> Decimal:
+        """
+        Decimal of summed weights. Whole numbers have exponent 0, like sums of ballots
+        at full value on the Decimal path, and others all decimals of precision.
+        >>> FixedPoint().to_decimal(6000000), FixedPoint().to_decimal(150000)
+        (Decimal('60'), Decimal('1.50000'))
+        """
+        if weight % self.unit:
+            return Decimal(weight).scaleb(-self.precision)
+        return Decimal(weight // self.unit)
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from decimal import Decimal
+from itertools import islice
+from typing import Callable, Iterable
+
+from stvpoll.types import Candidate, Candidates
+
+
+def rounding_method(value: Decimal) -> Decimal:
+    return round(value, 5).normalize()
+
+
+class PreferenceBallot(list[Candidate]):
+    def __init__(
+        self,
+        preferences: Iterable[Candidate],
+        count: int,
+        rounding: Callable[[Decimal], Decimal] = rounding_method,
+    ) -> None:
+        super().__init__(preferences)
+        self.count = count
+        self.multiplier = Decimal(1)
+        self.round = rounding
+        # Preferences before this position are no longer standing
+        self.position = 0
+
+    @property
+    def value(self) -> Decimal:
+        return self.multiplier * self.count
+
+    @property
+    def weight(self) -> Decimal:
+        """Value in representation of the ballot arithmetic, summed in vote transfers."""
+        return self.multiplier * self.count
+
+    def decrease_value(self, multiplier: Decimal) -> None:
+        self.multiplier = self.round(self.multiplier * multiplier)
+
+    def get_next_preference(
+        self, standing: Candidates | set[Candidate]
+    ) -> Candidate | None:
+        """
+        Get next candidate from preferences, from a list of standing candidates.
+        Preferences before the cursor are skipped, see advance().
+        >>> PreferenceBallot(('A', 'B', 'C'), 1).get_next_preference(('B', 'C'))
+        'B'
+        >>> PreferenceBallot(('A', 'B', 'C'), 1).get_next_preference(('D',))
+        """
+        return next(
+            (p for p in islice(self, self.position, None) if p in standing), None
+        )
+
+    def advance(self, standing: Candidates | set[Candidate]) -> Candidate | None:
+        """
+        Move cursor forward to current preference and return it.
+        Candidates only ever leave standing, so the cursor never has to move back.
+        >>> ballot = PreferenceBallot(('A', 'B', 'C'), 1)
+        >>> ballot.advance(('B', 'C'))
+        'B'
+        >>> ballot.advance(('A', 'C'))
+        'C'
+        >>> ballot.advance(())
+        >>> ballot.position
+        3
+        """
+        position = self.position
+        for preference in islice(self, position, None):
+            if preference in standing:
+                self.position = position
+                return preference
+            position += 1
+        self.position = position
+
+    def is_current_candidate(
+        self, candidate: Candidate, standing: Candidates | set[Candidate]
+    ) -> bool:
+        """
+        Assuming list of standing candidates, is candidate current preference on ballot?
+        >>> PreferenceBallot(('A', 'B', 'C'), 1).is_current_candidate('A', ('B', 'C'))
+        False
+        >>> PreferenceBallot(('A', 'B', 'C'), 1).is_current_candidate('B', ('B', 'C'))
+        True
+        """
+        return self.advance(standing) == candidate
+
+    def __repr__(self) -> str:
+        return f"PreferenceBallot([{','.join(map(str, self))}], {self.count})"
@@ -5,10 +5,12 @@ from typing import Iterator
 
 from more_itertools.recipes import partition
 
-from stvpoll.abcs import PreferenceBallot
+from stvpoll.arithmetic import Arithmetic, DecimalArithmetic
+from stvpoll.ballots import PreferenceBallot
 from stvpoll.exceptions import STVException, IncompleteResult
 from stvpoll.quotas import Quota
 from stvpoll.result import ElectionResult
+from stvpoll.store import BallotProfile, BallotStore
 from stvpoll.tiebreak_strategies import TiebreakStrategy
 from stvpoll.transfer_strategies import TransferStrategy
 from stvpoll.types import (
@@ -18,6 +20,7 @@ from stvpoll.types import (
     SelectionMethod,
     CandidateStatus,
     Votes,
+    VoteTransfers,
 )
 
 
@@ -26,47 +29,122 @@ def get_votes(
     candidates: Candidates,
     standing: set[Candidate],
 ) -> dict[Candidate, Decimal]:
-    return {
-        c: sum(
-            (b.value for b in ballots if b.is_current_candidate(c, standing)),
-            start=Decimal(0),
-        )
-        for c in candidates
-        if c in standing
-    }
+    """
+    Full recount of ballots, in a single pass over all ballots.
+    Ballot cursors are moved forward, so standing candidates may only decrease between calls.
+    >>> get_votes((PreferenceBallot((1, 2), 2), PreferenceBallot((2,), 1)), (1, 2, 3), {2, 3})
+    {2: Decimal('3'), 3: Decimal('0')}
+    """
+    votes = {c: Decimal(0) for c in candidates if c in standing}
+    for b in ballots:
+        if (c := b.advance(standing)) is not None:
+            votes[c] += b.value
+    return votes
+
+
+def get_bulk_exclusion(votes: Votes, quota: int | None, keep: int) -> Candidates:
+    """
+    Lowest candidates that can be excluded together, with the same result as excluding
+    them one at a time. Their combined votes are below the votes of the next candidate,
+    so they are the lowest candidates until all are excluded, and no candidate can reach
+    quota from their votes. At least keep candidates remain standing.
+    With a single winner, quota is the majority, so the count still stops in the round a
+    candidate could reach it. Without quota, candidates may reach it.
+    Returns candidates in order of votes, or nothing unless at least two can be excluded.
+    >>> get_bulk_exclusion({'A': 9, 'B': 4, 'C': 1, 'D': 2, 'E': 0}, 20, 2)
+    ('E', 'C', 'D')
+    >>> get_bulk_exclusion({'A': 9, 'B': 4, 'C': 1, 'D': 2, 'E': 0}, 12, 1)
+    ('E', 'C')
+    >>> get_bulk_exclusion({'A': 9, 'B': 4, 'C': 1, 'D': 2, 'E': 0}, None, 1)
+    ('E', 'C', 'D', 'B')
+    >>> get_bulk_exclusion({'A': 3, 'B': 2, 'C': 2}, 20, 1)
+    ()
+    """
+    ranked = sorted(votes, key=votes.__getitem__)
+    highest = max(votes.values(), default=0)
+    excluded = 0
+    total = 0
+    for count, candidate in enumerate(ranked[: len(ranked) - keep], start=1):
+        total += votes[candidate]
+        if quota is not None and highest + total >= quota:
+            break
+        if total < votes[ranked[count]]:
+            excluded = count
+    return tuple(ranked[:excluded]) if excluded > 1 else ()
 
 
 def get_ballots(
-    votes: BallotData, candidates: Candidates
-) -> tuple[int, tuple[PreferenceBallot, ...]]:
+    votes: BallotData | BallotProfile,
+    candidates: Candidates,
+    arithmetic: Arithmetic | None = None,
+    compact: bool = False,
+) -> tuple[int, tuple[PreferenceBallot, ...] | BallotStore]:
     """
     Turn ballot data into PreferenceBallot tuple and also report empty ballots.
-    :param votes: Can be a dict, Counter och iterable containing tuple of candidates and count
+    :param votes: Can be a dict, Counter och iterable containing tuple of candidates and count,
+                  or a BallotProfile, counted in a BallotStore without copying ballots.
     :param candidates: Tuple of candidates, used to ensure no ballot contain missing candidates.
+                       Names candidate indexes of a BallotProfile.
+    :param arithmetic: Arithmetic creating ballots, defaults to DecimalArithmetic
+    :param compact: Keep ballots in a BallotStore, instead of one object per ballot
     :return: Empty count and ballots.
     >>> get_ballots({(): 3, (1,2): 2}, (1,2))
     (3, (PreferenceBallot([1,2], 2),))
     >>> get_ballots([([], 3), ([1,2], 2)], (1,2))
     (3, (PreferenceBallot([1,2], 2),))
+    >>> _, store = get_ballots([([], 3), ([1,2], 2)], (1,2), compact=True)
+    >>> list(store)
+    [StoredBallot([1,2], 2)]
     """
+    if isinstance(votes, BallotProfile):
+        return votes.empty_ballot_count, BallotStore(votes, arithmetic, candidates)
+    if compact:
+        store = BallotStore(candidates, arithmetic)
+        for vote, count in votes.items() if isinstance(votes, dict) else votes:
+            store.add(vote, count)
+        return store.profile.empty_ballot_count, store
+    make_ballot = (arithmetic or DecimalArithmetic()).ballot
     if isinstance(votes, dict):
         ballots = tuple(
-            PreferenceBallot(vote, count) for vote, count in votes.items() if vote
+            make_ballot(vote, count) for vote, count in votes.items() if vote
         )
         empty_ballots = votes.get((), 0)
     else:
         empty, votes = partition(lambda v: v[0], votes)
         empty_ballots = sum((count for _, count in empty), start=0)
-        ballots = tuple(PreferenceBallot(tuple(vote), count) for vote, count in votes)
+        ballots = tuple(make_ballot(tuple(vote), count) for vote, count in votes)
     for ballot in ballots:
         if missing := next((c not in candidates for c in ballot), None):
             raise STVException(f"Candidate {missing} not in candidates: {ballot}")
     return empty_ballots, ballots
 
 
+def intern_ballots(
+    votes: BallotData | BallotProfile, candidates: Candidates
+) -> list[tuple[tuple[int, ...], int]] | BallotProfile:
+    """
+    Replace candidates in ballot data with their index in candidates.
+    A BallotProfile already keeps candidate indexes, and is returned as it is.
+    >>> intern_ballots({('B', 'A'): 2, (): 1}, ('A', 'B'))
+    [((1, 0), 2), ((), 1)]
+    """
+    if isinstance(votes, BallotProfile):
+        if votes.candidates != tuple(candidates):
+            raise STVException("Ballot profile has other candidates")
+        return votes
+    ids = {c: i for i, c in enumerate(candidates)}
+    try:
+        return [
+            (tuple(map(ids.__getitem__, vote)), count)
+            for vote, count in (votes.items() if isinstance(votes, dict) else votes)
+        ]
+    except KeyError as exc:
+        raise STVException(f"Candidate {exc.args[0]} not in candidates") from exc
+
+
 def calculate_stv(
     candidates: Candidates,
-    ballots: BallotData,
+    ballots: BallotData | BallotProfile,
     winners: int,
     *,
     pedantic_order: bool = False,
@@ -74,31 +152,51 @@ def calculate_stv(
     tiebreak_strategies: tuple[TiebreakStrategy, ...] = (),
     transfer_strategy: TransferStrategy,
     quota_method: Quota,
+    verify_tally: bool = False,
+    arithmetic: Arithmetic | None = None,
+    merge_interval: int = 0,
+    compact_ballots: bool = False,
+    bulk_exclusion: bool = False,
 ) -> ElectionResult:
     """
     Base STV calculation method
     :param candidates: All candidates - ballots may not have other candidates
-    :param ballots: All ballots, with count for each ballot
+    :param ballots: All ballots, with count for each ballot, or a shared BallotProfile
     :param winners: Number of winners
     :param pedantic_order: Use tiebreaking mechanism for election order of candidates above quota
     :param elect_last_standing: Set False to require all candidates above quota
     :param tiebreak_strategies: Tiebreaking strategies
     :param transfer_strategy: Strategy to transfer votes
     :param quota_method: Method to calculate quota
+    :param verify_tally: Recount all ballots every round, to check the running tally
+    :param arithmetic: Arithmetic for ballot weights, defaults to DecimalArithmetic
+    :param merge_interval: Merge equivalent ballots each time this many candidates have left
+    :param compact_ballots: Keep ballots in a BallotStore, to save memory on large polls
+    :param bulk_exclusion: Exclude all hopeless lowest candidates at once, see get_bulk_exclusion
     :return: Election result
     """
     if winners > len(candidates):
         raise STVException("Not enough candidates")
     result = ElectionResult(candidates=candidates, seats=winners)
-    result.empty_ballot_count, ballots = get_ballots(ballots, candidates)
+    arithmetic = arithmetic or DecimalArithmetic()
+    # Count with candidate indexes, mapping back to candidates in result
+    names = candidates
+    candidates = tuple(range(len(names)))
+    result.empty_ballot_count, ballots = get_ballots(
+        intern_ballots(ballots, names), candidates, arithmetic, compact_ballots
+    )
     standing = set(candidates)
     quota = quota_method(sum((b.count for b in ballots), start=0), winners)
+    piles = arithmetic.piles(ballots, candidates)
+    merged_standing = len(candidates)
 
     def transfer_votes(
         transfers: Candidates, vote_count: Votes, decrease_value: bool = False
     ) -> Votes:
+        """Transfer votes, returning the running tally for standing candidates."""
+        nonlocal merged_standing
         log, exhausted, vote_count = transfer_strategy(
-            ballots=ballots,
+            ballots=piles,
             quota=quota,
             decrease_value=decrease_value,
             transfers=transfers,
@@ -106,7 +204,18 @@ def calculate_stv(
             standing=tuple(standing),
         )
         result.exhausted += exhausted
-        result.transfer_log.append(log)
+        result.transfer_log.append(
+            VoteTransfers({(names[a], names[b]): v for (a, b), v in log.items()})
+        )
+        # Keep candidate order, so that the tally is interchangeable with a recount
+        vote_count = {c: vote_count[c] for c in candidates if c in standing}
+        if verify_tally and vote_count != (recount := piles.recount(candidates)):
+            raise STVException(f"Running tally {vote_count} differs from {recount}")
+        if merge_interval and merged_standing - len(standing) >= merge_interval:
+            ballot_count = len(piles)
+            piles.merge()
+            result.log_ballot_merge(ballot_count, len(piles))
+            merged_standing = len(standing)
         return vote_count
 
     def resolve_tiebreak(
@@ -114,12 +223,26 @@ def calculate_stv(
     ) -> tuple[Candidate, SelectionMethod]:
         """Go though tiebreaking methods in order, narrowing down to a single winner"""
         history = tuple(r.votes for r in result.rounds)
+        tied = tuple(names[c] for c in tied)
         for tiebreaker in tiebreak_strategies:
             tied = tiebreaker.resolve(tied, history, lowest=lowest)
             if not isinstance(tied, tuple):
-                return tied, tiebreaker.method
+                return names.index(tied), tiebreaker.method
         raise IncompleteResult("Could not break tie")
 
+    def select(
+        selected: Candidates,
+        votes: Votes,
+        method: SelectionMethod,
+        status: CandidateStatus = CandidateStatus.Elected,
+    ) -> None:
+        result.select(
+            tuple(names[c] for c in selected),
+            {names[c]: v for c, v in votes.items()},
+            method,
+            status,
+        )
+
     def iter_pedantic_order(
         tied: Candidates, current_votes: Votes
     ) -> Iterator[Candidate]:
@@ -135,14 +258,14 @@ def calculate_stv(
                 tied = tuple(c for c in tied if c != nxt)
             yield from tied
 
+    votes = piles.get_votes(candidates)
     with suppress(IncompleteResult):
         while standing and not result.complete:
-            votes = get_votes(ballots, candidates=candidates, standing=standing)
             if elect_last_standing and len(standing) <= winners - len(result):
                 last_standing = tuple(
                     sorted(standing, key=lambda c: votes[c], reverse=True)
                 )
-                result.select(last_standing, votes, SelectionMethod.NoCompetition)
+                select(last_standing, votes, SelectionMethod.NoCompetition)
                 break
 
             if above_quota := tuple(
@@ -154,12 +277,26 @@ def calculate_stv(
             ):
                 if pedantic_order:
                     above_quota = tuple(iter_pedantic_order(above_quota, votes))
-                result.select(above_quota, votes, SelectionMethod.Direct)
+                select(above_quota, votes, SelectionMethod.Direct)
                 standing.difference_update(above_quota)
                 votes = transfer_votes(
                     transfers=above_quota, vote_count=votes, decrease_value=True
                 )
 
+            elif bulk_exclusion and (
+                bulk := get_bulk_exclusion(votes, quota, max(winners - len(result), 1))
+            ):
+                # Recorded as excluded one at a time, in the same order
+                for exclude in bulk:
+                    select(
+                        (exclude,),
+                        votes,
+                        SelectionMethod.BulkExclusion,
+                        CandidateStatus.Excluded,
+                    )
+                standing.difference_update(bulk)
+                votes = transfer_votes(transfers=bulk, vote_count=votes)
+
             else:
                 min_votes = min(votes.values())
                 exclude = tuple(
@@ -169,7 +306,7 @@ def calculate_stv(
                     exclude, method = exclude[0], SelectionMethod.Direct
                 else:
                     exclude, method = resolve_tiebreak(exclude, lowest=True)
-                result.select(exclude, votes, method, CandidateStatus.Excluded)
+                select((exclude,), votes, method, CandidateStatus.Excluded)
                 standing.remove(exclude)
                 votes = transfer_votes(transfers=(exclude,), vote_count=votes)
 
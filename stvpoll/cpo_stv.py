@@ -1,33 +1,309 @@
 from __future__ import annotations
 
-from collections import defaultdict
-from collections.abc import Iterator
+from array import array
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import suppress
 from decimal import Decimal
-from itertools import combinations
-from math import factorial
+from itertools import chain, combinations, islice
+from math import comb, factorial
+from operator import itemgetter
+import os
 import random
+from sys import getsizeof
+from typing import Any, NamedTuple, TYPE_CHECKING
 
-from tarjan import tarjan
-from typing_extensions import NamedTuple
+from typing_extensions import deprecated
 
-from .abcs import STVPollBase, PreferenceBallot
+from .abcs import STVPollBase
+from .arithmetic import Arithmetic, strip_zeros
+from .ballots import PreferenceBallot
 from .base import get_ballots, get_votes
-from .exceptions import IncompleteResult, STVException
+from .exceptions import CPOLimitExceeded, IncompleteResult, STVException
 from .quotas import droop_quota, Quota
 from .result import ElectionResult
-from .types import BallotData, Candidates, Candidate, SelectionMethod
+from .scottish_stv import ScottishSTV, calculate_scottish_stv
+from .store import BallotProfile, BallotStore
+from .types import (
+    BallotData,
+    Candidates,
+    Candidate,
+    CPOTiebreak,
+    Duel,
+    Duels,
+    SelectionMethod,
+    Votes,
+)
 
+if TYPE_CHECKING:  # pragma: no coverage
+    from .vectorized import DuelMatrix
 
-class Duel(NamedTuple):
-    winner: Candidates
-    loser: Candidates
-    difference: Decimal
 
+class LRUCache:
+    """
+    Cache with at most maxsize items, evicting the least recently used item.
+    Counts hits and misses, and estimates memory of cached values with sizeof.
+    >>> cache = LRUCache(2)
+    >>> cache['a'] = 1
+    >>> cache['b'] = 2
+    >>> cache.get('a'), cache.get('c')
+    (1, None)
+    >>> cache['c'] = 3
+    >>> list(cache.items())
+    [('a', 1), ('c', 3)]
+    >>> cache.stats()
+    {'hits': 1, 'misses': 1, 'entries': 2, 'max_entries': 2, 'bytes': 56}
+    """
 
-Duels = tuple[Duel, ...]
+    def __init__(self, maxsize: int, sizeof: Callable[[Any], int] = getsizeof) -> None:
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self.data = OrderedDict()
+        self.sizes = {}
+        self.hits = self.misses = self.bytes = 0
 
+    def get(self, key: Hashable) -> Any:
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.data.move_to_end(key)
+        return value
 
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        if not self.maxsize:
+            return
+        self.data[key] = value
+        self.sizes[key] = self.sizeof(value)
+        self.bytes += self.sizes[key]
+        if len(self.data) > self.maxsize:
+            key, _ = self.data.popitem(last=False)
+            self.bytes -= self.sizes.pop(key)
+
+    def items(self) -> Iterable[tuple[Hashable, Any]]:
+        return self.data.items()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.data),
+            "max_entries": self.maxsize,
+            "bytes": self.bytes,
+        }
+
+
+def _votes_size(votes: dict[int, Decimal]) -> int:
+    return getsizeof(votes) + sum(map(getsizeof, votes.values()))
+
+
+def _ballots_size(ballots: DuelBallots) -> int:
+    return sum(
+        map(
+            getsizeof,
+            (
+                ballots.preferences,
+                ballots.offsets,
+                ballots.counts,
+                ballots.positions,
+                ballots.multipliers,
+                ballots.initial_multipliers,
+            ),
+        )
+    )
+
+
+class DuelBallots:
+    """
+    Ballots of CPO duels, over a BallotProfile that duels never change.
+    Multipliers and cursor positions of the duel being counted are scratch buffers,
+    reset for each duel, instead of copying every ballot for every duel.
+    Positions index the flat preferences array of the profile.
+    Multipliers round half to even to precision decimals, as rounding_method does with
+    the default precision. Duel worker processes rebuild ballots from the precision.
+    Duels count a projection of the ballots onto the candidates of both outcomes,
+    with identical projected ballots merged. Projections are cached by candidates,
+    and votes after surplus transfers by candidates, surplus order and quota, both
+    in caches of at most cache_size items.
+    >>> profile = BallotProfile(('A', 'B', 'C', 'D'))
+    >>> profile.add(('A', 'D', 'C'), 2)
+    >>> profile.add(('A', 'C'), 1)
+    >>> profile.add(('B', 'D'), 1)
+    >>> ballots = DuelBallots(profile)
+    >>> outcomes_duel(ballots, (('A', 'B'), ('A', 'C')), 2)
+    Duel(winner=('A', 'B'), loser=('A', 'C'), difference=Decimal('0.00001'))
+    >>> projection = ballots.project(frozenset((0, 1, 2)))
+    >>> projection.preferences, projection.counts
+    (array('i', [0, 2, 1]), array('q', [3, 1]))
+    >>> projection.multipliers, projection.positions
+    ([Decimal('0.33333'), Decimal('1')], array('q', [0, 2]))
+    """
+
+    def __init__(
+        self,
+        profile: BallotProfile,
+        candidates: Iterable[Candidate] | None = None,
+        precision: int = 5,
+        cache_size: int = 1024,
+    ) -> None:
+        self.profile = profile
+        self.candidates = (
+            profile.candidates if candidates is None else tuple(candidates)
+        )
+        self.index = {c: i for i, c in enumerate(self.candidates)}
+        self.precision = precision
+        self.preferences = profile.preferences
+        self.offsets = profile.offsets
+        self.counts = profile.counts
+        self.initial_multipliers = [Decimal(1)] * len(profile)
+        self.multipliers = self.initial_multipliers[:]
+        self.positions = array("q", self.offsets[:-1])
+        self.projections = LRUCache(cache_size, _ballots_size)
+        self.transfers = LRUCache(cache_size, _votes_size)
+        # Cache stats of worker processes that counted duels of these ballots
+        self.worker_cache_stats: list[dict[str, dict[str, int]]] = []
+
+    @classmethod
+    def from_ballots(
+        cls,
+        ballots: Iterable[PreferenceBallot] | BallotStore,
+        candidates: Candidates,
+        cache_size: int = 1024,
+    ) -> DuelBallots:
+        """Duel ballots over the profile of a BallotStore, or a profile of ballots."""
+        if isinstance(ballots, BallotStore):
+            return cls(ballots.profile, ballots.candidates, cache_size=cache_size)
+        profile = BallotProfile(candidates)
+        for ballot in ballots:
+            profile.add(ballot, ballot.count)
+        return cls(profile, cache_size=cache_size)
+
+    def project(self, candidates: frozenset[int]) -> DuelBallots:
+        """
+        Ballots with only preferences in candidates, merging identical ballots.
+        Other candidates never stand in the duel, so counting is the same.
+        Projects the smallest cached projection with all candidates, if any.
+        """
+        if (projection := self.projections.get(candidates)) is not None:
+            return projection
+        source = min(
+            (p for c, p in self.projections.items() if candidates < c),
+            key=len,
+            default=self,
+        )
+        preferences, offsets, counts = (
+            source.preferences,
+            source.offsets,
+            source.counts,
+        )
+        merged: dict[tuple[int, ...], int] = {}
+        for row in range(len(source)):
+            if ranking := tuple(
+                c
+                for c in preferences[offsets[row] : offsets[row + 1]]
+                if c in candidates
+            ):
+                merged[ranking] = merged.get(ranking, 0) + counts[row]
+        profile = BallotProfile(self.candidates)
+        for ranking, count in merged.items():
+            profile.add(map(self.candidates.__getitem__, ranking), count)
+        projection = self.projections[candidates] = DuelBallots(
+            profile, precision=self.precision, cache_size=0
+        )
+        return projection
+
+    def vectorize(self) -> DuelMatrix:
+        """DuelMatrix of the profile, counting batches of duels with NumPy."""
+        from .vectorized import DuelMatrix
+
+        return DuelMatrix(self.profile, self.candidates, self.precision)
+
+    def cache_stats(self) -> dict[str, dict[str, int]]:
+        """
+        Hits, misses and estimated memory of duel caches, to size them.
+        Caches of worker processes are added, so entries, max_entries and bytes are
+        totals over all processes.
+        """
+        stats = {
+            "transfers": self.transfers.stats(),
+            "projections": self.projections.stats(),
+        }
+        for worker in self.worker_cache_stats:
+            for name, counts in worker.items():
+                for key, value in counts.items():
+                    stats[name][key] += value
+        return stats
+
+    def reset(self) -> None:
+        """Set initial multipliers and positions, in place, before counting a duel."""
+        self.multipliers[:] = self.initial_multipliers
+        self.positions[:] = self.offsets[:-1]
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def advance(self, row: int, standing: set[int]) -> int | None:
+        """Move cursor of ballot forward to current preference and return it."""
+        preferences = self.preferences
+        end = self.offsets[row + 1]
+        for position in range(self.positions[row], end):
+            if preferences[position] in standing:
+                self.positions[row] = position
+                return preferences[position]
+        self.positions[row] = end
+
+    def get_next_preference(self, row: int, standing: set[int]) -> int | None:
+        """Next standing preference of ballot, from the cursor."""
+        preferences = self.preferences
+        for position in range(self.positions[row], self.offsets[row + 1]):
+            if preferences[position] in standing:
+                return preferences[position]
+
+    def count_votes(
+        self, standing: frozenset[int], surplus: tuple[int, ...], quota: int
+    ) -> dict[int, Decimal]:
+        """Votes of standing candidates, after transferring surplus of candidates in order."""
+        self.reset()
+        standing = set(standing)
+        counts = self.counts
+        # Count initial votes after primary transfers.
+        initial_votes = dict.fromkeys(standing, 0)
+        for row in range(len(self)):
+            if (current := self.advance(row, standing)) is not None:
+                initial_votes[current] += counts[row]
+        votes = {c: Decimal(v) for c, v in initial_votes.items()}
+
+        for candidate in surplus:
+            if votes[candidate] > quota:
+                # Set candidates votes to quota and get fraction to transfer
+                votes[candidate], transfer_fraction = (
+                    Decimal(quota),
+                    (votes[candidate] - quota) / votes[candidate],
+                )
+                others = standing.difference((candidate,))
+                # Do the actual transfer, according to fraction
+                for row in range(len(self)):
+                    if self.advance(row, standing) == candidate:
+                        value = self.decrease_value(row, transfer_fraction)
+                        if (
+                            next_preference := self.get_next_preference(row, others)
+                        ) is not None:
+                            votes[next_preference] += value
+            standing.remove(candidate)
+        return votes
+
+    def decrease_value(self, row: int, multiplier: Decimal) -> Decimal:
+        """Decrease multiplier of ballot, and return its new value."""
+        self.multipliers[row] = round(
+            self.multipliers[row] * multiplier, self.precision
+        ).normalize()
+        return self.multipliers[row] * self.counts[row]
+
+
+@deprecated("Not used by CPO-STV duels, that count DuelBallots")
 def iter_candidate_ballots(
     ballots: tuple[PreferenceBallot, ...],
     candidate: Candidate,
@@ -40,44 +316,34 @@ def iter_candidate_ballots(
 
 
 def outcomes_duel(
-    ballots: tuple[PreferenceBallot, ...],
+    ballots: DuelBallots | Iterable[PreferenceBallot],
     compared: tuple[Candidates, Candidates],
     quota: int,
 ):
-    """Perform comparison between outcomes, returning a memory efficient named tuple"""
+    """
+    Perform comparison between outcomes, returning a memory efficient named tuple.
+    Ballots are DuelBallots, or else ballots copied into DuelBallots of their own.
+    """
+    if not isinstance(ballots, DuelBallots):
+        ballots = tuple(ballots)
+        candidates = tuple(dict.fromkeys(chain(*compared, *ballots)))
+        ballots = DuelBallots.from_ballots(ballots, candidates, cache_size=0)
+    index = ballots.index
     outcome1, outcome2 = set(compared[0]), set(compared[1])
     # Eliminate candidates in neither outcome
-    standing = outcome1 | outcome2
-    # Count initial votes after primary transfers.
-    votes = {
-        c: Decimal(
-            sum(
-                (b.count for b in iter_candidate_ballots(ballots, c, standing)), start=0
-            )
+    standing = frozenset(index[c] for c in outcome1 | outcome2)
+    # Transfer surpluses of candidates in both outcomes, in this order
+    surplus = tuple(map(index.__getitem__, outcome1 & outcome2))
+    # Outcome pairs with the same candidates in and between them have the same votes
+    key = (standing, surplus, quota)
+    if (votes := ballots.transfers.get(key)) is None:
+        votes = ballots.transfers[key] = ballots.project(standing).count_votes(
+            standing, surplus, quota
         )
-        for c in standing
-    }
-
-    # Transfer surpluses of candidates in both outcomes
-    for candidate in outcome1 & outcome2:
-        if votes[candidate] > quota:
-            # Set candidates votes to quota and get fraction to transfer
-            votes[candidate], transfer_fraction = (
-                Decimal(quota),
-                (votes[candidate] - quota) / votes[candidate],
-            )
-            # Do the actual transfer, according to fraction
-            for ballot in iter_candidate_ballots(ballots, candidate, standing):
-                ballot.decrease_value(transfer_fraction)
-                if next_preference := ballot.get_next_preference(
-                    standing.difference((candidate,))
-                ):
-                    votes[next_preference] += ballot.value
-        standing.remove(candidate)
 
     # Add up the totals
     totals = sorted(
-        ((outcome, sum(votes[c] for c in outcome)) for outcome in compared),
+        ((outcome, sum(votes[index[c]] for c in outcome)) for outcome in compared),
         key=lambda c: c[1],
     )
     # May be unclear here, but winner or loser does not matter if tied
@@ -88,61 +354,690 @@ def outcomes_duel(
     )
 
 
-def get_duels_winner(duels: Duels) -> Candidates | None:
-    wins = set[Candidates]()
-    losses = set[Candidates]()
-    for duel in duels:
-        losses.add(duel.loser)
-        if not duel.difference:
-            losses.add(duel.winner)
+# Ballots, outcomes and quota of a duel worker process
+_duel_worker: dict = {}
+
+
+def _init_duel_worker(
+    name: str,
+    candidates: Candidates,
+    ballots: int,
+    precision: int,
+    cache_size: int,
+    outcomes: tuple[Candidates, ...],
+    quota: int,
+    vectorized: bool,
+) -> None:
+    profile = BallotProfile.attach(candidates, name, ballots)
+    duel_ballots = DuelBallots(profile, precision=precision, cache_size=cache_size)
+    _duel_worker.update(
+        ballots=duel_ballots,
+        matrix=duel_ballots.vectorize() if vectorized else None,
+        outcomes=outcomes,
+        quota=quota,
+    )
+
+
+def _run_duels(
+    rows: range,
+) -> tuple[list[Duel], int, dict[str, dict[str, int]]]:
+    """
+    Duels of outcomes in rows against all later outcomes, in a worker process.
+    Also returns the process id, and cache stats of the worker so far.
+    """
+    ballots, outcomes, quota = (
+        _duel_worker["ballots"],
+        _duel_worker["outcomes"],
+        _duel_worker["quota"],
+    )
+    compared = (
+        (outcomes[i], outcomes[j]) for i in rows for j in range(i + 1, len(outcomes))
+    )
+    if matrix := _duel_worker["matrix"]:
+        duels = list(matrix.duels(compared, quota))
+    else:
+        duels = [outcomes_duel(ballots, pair, quota) for pair in compared]
+    return duels, os.getpid(), ballots.cache_stats()
+
+
+def iter_pairwise_duels(
+    ballots: DuelBallots,
+    outcomes: tuple[Candidates, ...],
+    quota: int,
+    processes: int = 0,
+    vectorized: bool = False,
+) -> Iterator[Duel]:
+    """
+    Duels of all pairs of outcomes, in the order of combinations, as they are counted.
+    With processes, duels run in a pool of that many worker processes, reading ballots
+    from shared memory. Each task is outcomes of some rows against all later outcomes,
+    with tasks of about the same number of duels. Results are in the same order.
+    Workers have caches of their own, with stats added to those of ballots.
+    Vectorized duels are counted in batches by a DuelMatrix, without caches.
+    """
+    if not processes:
+        if vectorized:
+            yield from ballots.vectorize().duels(combinations(outcomes, 2), quota)
+            return
+        for compared in combinations(outcomes, 2):
+            yield outcomes_duel(ballots, compared, quota)
+        return
+    task_size = len(outcomes) * (len(outcomes) - 1) // 2 // (processes * 4) + 1
+    tasks, start, size = [], 0, 0
+    for row in range(len(outcomes)):
+        size += len(outcomes) - 1 - row
+        if size >= task_size:
+            tasks.append(range(start, row + 1))
+            start, size = row + 1, 0
+    tasks.append(range(start, len(outcomes)))
+    memory = ballots.profile.share()
+    # Latest cache stats of each worker, which add up over its tasks
+    worker_stats = {}
+    try:
+        with ProcessPoolExecutor(
+            processes,
+            initializer=_init_duel_worker,
+            initargs=(
+                memory.name,
+                ballots.candidates,
+                len(ballots),
+                ballots.precision,
+                ballots.transfers.maxsize,
+                outcomes,
+                quota,
+                vectorized,
+            ),
+        ) as executor:
+            for duels, pid, stats in executor.map(_run_duels, tasks):
+                worker_stats[pid] = stats
+                yield from duels
+    finally:
+        ballots.worker_cache_stats.extend(worker_stats.values())
+        memory.close()
+        memory.unlink()
+
+
+def get_outcome_pruning(
+    ballots: DuelBallots,
+    votes: Votes,
+    seats: int,
+    quota: int,
+    prune_hopeless: bool = False,
+    prune_required: bool = True,
+) -> tuple[Candidates, Candidates]:
+    """
+    Candidates required in every outcome, and candidates left out of all outcomes.
+    Candidates with a quota of first preferences are required, unless more than seats do,
+    or prune_required is False.
+    With prune_hopeless, candidates ranked on fewer ballots than the first preferences of
+    seats other candidates are left out. They trail those candidates in every round of
+    STV, and would be excluded before any transfer could help them.
+    >>> profile = BallotProfile(('A', 'B', 'C', 'D'))
+    >>> profile.add(('A', 'D'), 4)
+    >>> profile.add(('B',), 2)
+    >>> profile.add(('C', 'D'), 1)
+    >>> votes = {'A': 4, 'B': 2, 'C': 1, 'D': 0}
+    >>> get_outcome_pruning(DuelBallots(profile), votes, 2, 3)
+    (('A',), ())
+    >>> get_outcome_pruning(DuelBallots(profile), votes, 2, 3, prune_hopeless=True)
+    (('A',), ('C',))
+    >>> get_outcome_pruning(DuelBallots(profile), votes, 2, 3, prune_required=False)
+    ((), ())
+    """
+    required = tuple(c for c, v in votes.items() if v >= quota and prune_required)
+    if len(required) > seats:
+        required = ()
+    if not prune_hopeless:
+        return required, ()
+    mentions = dict.fromkeys(range(len(ballots.candidates)), 0)
+    preferences, offsets, counts = ballots.preferences, ballots.offsets, ballots.counts
+    for row in range(len(ballots)):
+        for candidate in set(preferences[offsets[row] : offsets[row + 1]]):
+            mentions[candidate] += counts[row]
+    hopeless = tuple(
+        candidate
+        for candidate in votes
+        if sum(v > mentions[ballots.index[candidate]] for v in votes.values()) >= seats
+    )
+    return required, hopeless
+
+
+def get_outcomes(
+    candidates: Candidates, seats: int, required: Candidates = ()
+) -> Iterator[Candidates]:
+    """
+    Possible outcomes, with all required candidates, in the order of combinations.
+    >>> list(get_outcomes(('A', 'B', 'C', 'D'), 3, ('B',)))
+    [('A', 'B', 'C'), ('A', 'B', 'D'), ('B', 'C', 'D')]
+    """
+    if not required:
+        return combinations(candidates, seats)
+    order = {c: i for i, c in enumerate(candidates)}
+    others = tuple(c for c in candidates if c not in required)
+    return (
+        tuple(sorted((*required, *outcome), key=order.__getitem__))
+        for outcome in combinations(others, seats - len(required))
+    )
+
+
+def find_condorcet_outcome(
+    ballots: DuelBallots,
+    candidates: Candidates,
+    seats: int,
+    quota: int,
+    required: Candidates = (),
+) -> Candidates | None:
+    """
+    Outcome winning duels against all other outcomes, if any, in at most 2N duels.
+    A running winner duels each next outcome, and is then checked against outcomes
+    before it. Duels compare outcomes in the order of all pairwise duels, so the
+    outcome is the one DuelResults.get_winner() would find after all of them.
+    >>> profile = BallotProfile(('A', 'B', 'C'))
+    >>> profile.add(('B', 'C'), 3)
+    >>> profile.add(('C',), 2)
+    >>> profile.add(('A',), 1)
+    >>> find_condorcet_outcome(DuelBallots(profile), profile.candidates, 2, 2)
+    ('B', 'C')
+    """
+    outcomes = get_outcomes(candidates, seats, required)
+    champion = next(outcomes, None)
+    position = 0
+    for index, outcome in enumerate(outcomes, start=1):
+        duel = outcomes_duel(ballots, (champion, outcome), quota)
+        if duel.winner != champion or not duel.difference:
+            champion, position = outcome, index
+    for outcome in islice(get_outcomes(candidates, seats, required), position):
+        duel = outcomes_duel(ballots, (outcome, champion), quota)
+        if duel.winner != champion or not duel.difference:
+            return None
+    return champion
+
+
+def iter_bits(bits: int) -> Iterator[int]:
+    """
+    Indexes of set bits, lowest first.
+    >>> list(iter_bits(0b10110))
+    [1, 2, 4]
+    """
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+
+# Decimals of margins kept as integer units, those of the default rounding method
+MARGIN_DECIMALS = 5
+
+
+class DuelResults:
+    """
+    Duel results folded into a record per outcome as duels arrive, instead of keeping
+    all duels: whether the outcome won or lost any duel (a tie is a loss for both), its
+    largest defeat, and a bitset of outcomes that beat or tied it.
+    With keep_margins, margins are kept as well, for Ranked Pairs, in a dense matrix of
+    one signed margin per pair of outcomes, indexed by the order of combinations.
+    Smith set and minimax read the records, not the margins, so they need no matrix:
+    records take a bit per pair of outcomes, where margins take eight bytes.
+    Margins are integer units of the default rounding in an array, unless any duel has
+    finer margins.
+    Duels must arrive in the order of combinations of outcomes.
+    >>> outcomes = (('A',), ('B',), ('C',))
+    >>> results = DuelResults(outcomes)
+    >>> results.add(Duel(('B',), ('A',), Decimal(2)))
+    >>> results.add(Duel(('A',), ('C',), Decimal(3)))
+    >>> results.add(Duel(('C',), ('B',), Decimal(1)))
+    >>> results.get_winner()
+    >>> [outcomes[i] for i in results.get_smith_set()]
+    [('C',), ('B',), ('A',)]
+    >>> results.resolve_tie_minimax(False, None)
+    ('B',)
+    """
+
+    def __init__(
+        self, outcomes: tuple[Candidates, ...], keep_margins: bool = False
+    ) -> None:
+        self.outcomes = outcomes
+        self.index = {outcome: i for i, outcome in enumerate(outcomes)}
+        self.won = bytearray(len(outcomes))
+        self.lost = bytearray(len(outcomes))
+        self.largest_defeat = [Decimal(0)] * len(outcomes)
+        self.beaten_by = [0] * len(outcomes)
+        # Loser of the first duel, where the search for the Smith set starts
+        self.first_loser: int | None = None
+        self.margins: array | list[Decimal] | None = (
+            array("q") if keep_margins else None
+        )
+
+    def add(self, duel: Duel) -> None:
+        winner, loser = self.index[duel.winner], self.index[duel.loser]
+        if self.first_loser is None:
+            self.first_loser = loser
+        self.lost[loser] = 1
+        self.beaten_by[loser] |= 1 << winner
+        if duel.difference:
+            self.won[winner] = 1
+            if duel.difference > self.largest_defeat[loser]:
+                self.largest_defeat[loser] = duel.difference
         else:
-            wins.add(duel.winner)
+            self.lost[winner] = 1
+            self.beaten_by[winner] |= 1 << loser
+        if self.margins is not None:
+            # Margin of the earlier outcome over the later one
+            self._add_margin(duel.difference if winner < loser else -duel.difference)
+
+    def _add_margin(self, margin: Decimal) -> None:
+        if isinstance(self.margins, array):
+            units = margin.scaleb(MARGIN_DECIMALS)
+            if units == units.to_integral_value() and abs(units) < 2**63:
+                self.margins.append(int(units))
+                return
+            # Finer than the default rounding, so keep margins as Decimal
+            self.margins = [
+                strip_zeros(Decimal(m).scaleb(-MARGIN_DECIMALS)) for m in self.margins
+            ]
+        self.margins.append(margin)
+
+    def _pair_index(self, first: int, second: int) -> int:
+        """Index of a pair of outcomes, first before second, in order of combinations."""
+        return first * (2 * len(self.outcomes) - first - 1) // 2 + second - first - 1
+
+    def get_margin(self, outcome: int, other: int) -> Decimal:
+        """
+        Margin of outcome over other, negative if other won.
+        >>> results = DuelResults((('A',), ('B',), ('C',)), keep_margins=True)
+        >>> results.add(Duel(('B',), ('A',), Decimal('0.5')))
+        >>> results.get_margin(0, 1), results.get_margin(1, 0)
+        (Decimal('-0.5'), Decimal('0.5'))
+        """
+        if other < outcome:
+            return -self.get_margin(other, outcome)
+        margin = self.margins[self._pair_index(outcome, other)]
+        if isinstance(self.margins, array):
+            return strip_zeros(Decimal(margin).scaleb(-MARGIN_DECIMALS))
+        return margin
 
-    undefeated = wins - losses
-    if len(undefeated) == 1:
-        # If there is ONE clear winner (won all duels), return that combination.
-        return undefeated.pop()
+    def get_winner(self) -> Candidates | None:
+        """The one outcome that won duels and lost none, if there is one."""
+        undefeated = [
+            i for i in range(len(self.outcomes)) if self.won[i] and not self.lost[i]
+        ]
+        if len(undefeated) == 1:
+            return self.outcomes[undefeated[0]]
 
+    def iter_beaten_by(self, outcome: int) -> Iterable[int]:
+        """Outcomes that beat or tied outcome, in outcome order."""
+        return iter_bits(self.beaten_by[outcome])
 
+    def get_smith_set(self) -> list[int]:
+        """
+        Outcomes of the top cycle, when there is no Condorcet winner.
+        First strongly connected component found by Tarjan's algorithm, following
+        edges from each outcome to outcomes that beat or tied it. Outcomes are in the
+        order of the former graph of duels, keeping random tiebreaks as they were.
+        """
+        index = {self.first_loser: 0}
+        lowlink = {self.first_loser: 0}
+        stack = [self.first_loser]
+        on_stack = {self.first_loser}
+        work = [(self.first_loser, self.iter_beaten_by(self.first_loser))]
+        while work:
+            v, successors = work[-1]
+            for w in successors:
+                if w not in index:
+                    index[w] = lowlink[w] = len(index)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, self.iter_beaten_by(w)))
+                    break
+                if w in on_stack:
+                    lowlink[v] = min(lowlink[v], index[w])
+            else:
+                work.pop()
+                if lowlink[v] == index[v]:
+                    component = []
+                    while not component or component[-1] != v:
+                        component.append(stack.pop())
+                    return component
+                lowlink[work[-1][0]] = min(lowlink[work[-1][0]], lowlink[v])
+        raise STVException("No duels")  # pragma: no coverage
+
+    def resolve_tie_minimax(
+        self, allow_random: bool, result: ElectionResult
+    ) -> Candidates:
+        """Outcome of the Smith set with the smallest largest defeat."""
+        smith_set = self.get_smith_set()
+        minimal_defeat = min(self.largest_defeat[i] for i in smith_set)
+        return self._choose(
+            [i for i in smith_set if self.largest_defeat[i] == minimal_defeat],
+            allow_random,
+            result,
+        )
+
+    def resolve_tie_ranked_pairs(
+        self, allow_random: bool, result: ElectionResult
+    ) -> Candidates:
+        """
+        Outcome of the Smith set that no locked duel beats, by Ranked Pairs.
+        Duels between outcomes of the Smith set are locked from the largest margin down,
+        unless the loser already reaches the winner through locked duels. Equal margins
+        lock in the order of duels, so they never depend on chance. Ranked Pairs always
+        elects from the Smith set, so other outcomes are left out.
+        Bitsets of the outcomes each outcome reaches, and is reached by, are updated
+        as duels lock, so checking a duel for a cycle is a bit test.
+        >>> outcomes = (('A',), ('B',), ('C',))
+        >>> results = DuelResults(outcomes, keep_margins=True)
+        >>> results.add(Duel(('B',), ('A',), Decimal(2)))
+        >>> results.add(Duel(('A',), ('C',), Decimal(3)))
+        >>> results.add(Duel(('C',), ('B',), Decimal(1)))
+        >>> results.resolve_tie_ranked_pairs(False, None)
+        ('B',)
+        """
+        if self.margins is None:
+            raise STVException("Ranked Pairs requires duel results with margins")
+        smith_set = self.get_smith_set()
+        members = sorted(smith_set)
+        margins = self.margins
+        # Decided duels between members, in order of combinations
+        pairs = []
+        for position, first in enumerate(members):
+            row = self._pair_index(first, first + 1) - first - 1
+            for second in members[position + 1 :]:
+                if margin := margins[row + second]:
+                    pairs.append(
+                        (margin, first, second)
+                        if margin > 0
+                        else (-margin, second, first)
+                    )
+        # Stable, so equal margins stay in order of duels
+        pairs.sort(key=itemgetter(0), reverse=True)
+        reaches = {i: 1 << i for i in smith_set}
+        reached_by = reaches.copy()
+        beaten = 0
+        for _, winner, loser in pairs:
+            if reaches[loser] >> winner & 1:
+                continue  # Would lock a cycle
+            beaten |= 1 << loser
+            if reaches[winner] >> loser & 1:
+                continue  # Already reached through other locked duels
+            for i in iter_bits(reached_by[winner]):
+                reaches[i] |= reaches[loser]
+            for i in iter_bits(reaches[loser]):
+                reached_by[i] |= reached_by[winner]
+        return self._choose(
+            [i for i in smith_set if not beaten >> i & 1], allow_random, result
+        )
+
+    def _choose(
+        self, winners: list[int], allow_random: bool, result: ElectionResult
+    ) -> Candidates:
+        if len(winners) == 1:
+            return self.outcomes[winners[0]]
+        if not allow_random:
+            raise IncompleteResult("Random in tiebreaks disallowed")
+        result.set_randomized()
+        return random.choice([self.outcomes[i] for i in winners])
+
+
+def get_duels_result(
+    ballots: DuelBallots,
+    outcomes: tuple[Candidates, ...],
+    quota: int,
+    allow_random: bool,
+    result: ElectionResult,
+    processes: int = 0,
+    vectorized: bool = False,
+    tiebreak: CPOTiebreak = CPOTiebreak.Minimax,
+) -> Candidates:
+    """
+    Outcome winning all pairwise duels, or else resolved by minimax or Ranked Pairs.
+    Duel results are folded into DuelResults as they are counted.
+    """
+    tiebreak = CPOTiebreak(tiebreak)
+    duel_results = DuelResults(
+        outcomes, keep_margins=tiebreak == CPOTiebreak.RankedPairs
+    )
+    for duel in iter_pairwise_duels(ballots, outcomes, quota, processes, vectorized):
+        duel_results.add(duel)
+    if winner := duel_results.get_winner():
+        return winner
+    if tiebreak == CPOTiebreak.RankedPairs:
+        return duel_results.resolve_tie_ranked_pairs(allow_random, result)
+    return duel_results.resolve_tie_minimax(allow_random, result)
+
+
+def _fold_duels(duels: Duels) -> DuelResults:
+    """DuelResults of duels, with outcomes in order of appearance."""
+    outcomes = tuple(dict.fromkeys(o for duel in duels for o in duel[:2]))
+    duel_results = DuelResults(outcomes)
+    for duel in duels:
+        duel_results.add(duel)
+    return duel_results
+
+
+@deprecated("Use DuelResults.get_winner() instead")
+def get_duels_winner(duels: Duels) -> Candidates | None:
+    return _fold_duels(duels).get_winner()
+
+
+@deprecated("Use DuelResults.resolve_tie_minimax() instead")
 def resolve_tie_minimax(
     duels: Duels, allow_random: bool, result: ElectionResult
 ) -> Candidates:
-    graph = defaultdict(list)
-    for d in duels:
-        graph[d.loser].append(d.winner)
-        if not d.difference:
-            graph[d.winner].append(d.loser)
-
-    # The smith set is a set of winners at the top-cycle, when there is no Condorcet winner.
-    smith_set: list[Candidates] = tarjan(graph)[0]
-
-    biggest_defeats = {
-        candidates: max(
-            (duel.difference for duel in duels if duel.loser == candidates),
-            default=Decimal(0),
+    return _fold_duels(duels).resolve_tie_minimax(allow_random, result)
+
+
+class CPOEstimate(NamedTuple):
+    """Estimated cost of a CPO-STV count, where all pairs of outcomes duel."""
+
+    outcomes: int
+    duels: int
+    memory: int
+    seconds: float
+
+
+def estimate_cpo_cost(
+    candidates: int,
+    seats: int,
+    rankings: int,
+    preferences: int,
+    *,
+    required: int = 0,
+    processes: int = 0,
+    duel_cache_size: int = 1024,
+    tiebreak: CPOTiebreak = CPOTiebreak.Minimax,
+) -> CPOEstimate:
+    """
+    Outcomes, duels, memory in bytes and runtime in seconds of counting a CPO-STV poll,
+    from the number of candidates, seats, ballot rankings and preferences on them.
+    Required candidates are in every outcome. Duels are all pairs of outcomes, the
+    worst case, while the Condorcet search usually needs about two per outcome.
+    Memory and runtime are rough, calibrated on benchmark polls of 7 to 12 candidates
+    with up to 20000 ballots, to within a factor of two.
+    >>> estimate = estimate_cpo_cost(30, 10, 1000, 5000)
+    >>> estimate.outcomes, estimate.duels, round(estimate.seconds / 86400)
+    (30045015, 451351448152605, 809716)
+    >>> estimate_cpo_cost(7, 3, 300, 1000)
+    CPOEstimate(outcomes=35, duels=595, memory=1241480, seconds=0.04)
+    """
+    outcomes = comb(candidates - required, seats - required)
+    duels = comb(outcomes, 2)
+    profile = 4 * preferences + 40 * rankings
+    # Projections onto candidates of two outcomes, smaller with fewer candidates
+    standing = min(candidates, 2 * seats)
+    projections = min(
+        duel_cache_size,
+        sum(comb(candidates, k) for k in range(seats + 1, standing + 1)),
+    )
+    memory = (
+        profile
+        + projections * profile * standing // candidates
+        + min(duel_cache_size, duels) * 100 * standing
+        # Results per outcome, with a bitset of outcomes beating it
+        + outcomes * (outcomes // 8 + 100 + 8 * seats)
+    )
+    if CPOTiebreak(tiebreak) == CPOTiebreak.RankedPairs:
+        memory += duels * 8
+    # About 45 us per duel and 22 ns per preference, counted in one process
+    seconds = duels * (45e-6 + 22e-9 * preferences) / max(processes, 1)
+    return CPOEstimate(outcomes, duels, memory, round(seconds, 2))
+
+
+class CPOLimits(NamedTuple):
+    """
+    Largest CPO-STV count to start, by estimate_cpo_cost. None is no limit.
+    Counts over a limit raise CPOLimitExceeded, or with fallback are counted with
+    Scottish STV instead, recorded as cpo_fallback in the result.
+    >>> CPOLimits(seconds=60).check(estimate_cpo_cost(30, 10, 1000, 5000))
+    Traceback (most recent call last):
+    ...
+    stvpoll.exceptions.CPOLimitExceeded: CPO-STV count over limits: seconds 69959474463.65 > 60
+    """
+
+    outcomes: int | None = None
+    duels: int | None = None
+    memory: int | None = None
+    seconds: float | None = None
+    fallback: bool = False
+
+    def check(self, estimate: CPOEstimate) -> None:
+        exceeded = [
+            f"{name} {value} > {limit}"
+            for name, value, limit in zip(estimate._fields, estimate, self)
+            if limit is not None and value > limit
+        ]
+        if exceeded:
+            raise CPOLimitExceeded(
+                f"CPO-STV count over limits: {', '.join(exceeded)}", estimate
+            )
+
+
+def get_cpo_outcome(
+    ballots: DuelBallots,
+    candidates: Candidates,
+    seats: int,
+    quota: int,
+    votes: Votes,
+    result: ElectionResult,
+    *,
+    allow_random: bool = True,
+    condorcet_search: bool = True,
+    prune_hopeless: bool = False,
+    prune_required: bool = True,
+    processes: int = 0,
+    vectorized: bool = False,
+    tiebreak: CPOTiebreak = CPOTiebreak.Minimax,
+    limits: CPOLimits | None = None,
+) -> Candidates:
+    """
+    Best outcome of seats candidates, from first preference votes and duels.
+    Outcome pruning and duel cache stats are logged in result.
+    Counts over limits raise CPOLimitExceeded before any duel.
+    """
+    required, excluded = get_outcome_pruning(
+        ballots, votes, seats, quota, prune_hopeless, prune_required
+    )
+    remaining = tuple(c for c in candidates if c not in excluded)
+    result.log_outcome_pruning(
+        required,
+        excluded,
+        comb(len(candidates), seats),
+        comb(len(remaining) - len(required), seats - len(required)),
+    )
+    if limits is not None:
+        limits.check(
+            estimate_cpo_cost(
+                len(remaining),
+                seats,
+                len(ballots),
+                len(ballots.preferences),
+                required=len(required),
+                processes=processes,
+                duel_cache_size=ballots.transfers.maxsize,
+                tiebreak=tiebreak,
+            )
         )
-        for candidates in smith_set
-    }
-    minimal_defeat = min(biggest_defeats.values())
-    winners = [
-        candidates
-        for candidates, diff in biggest_defeats.items()
-        if diff == minimal_defeat
-    ]
-    if len(winners) == 1:  # pragma: no coverage
-        return winners[0]
-    if not allow_random:
-        raise IncompleteResult("Random in tiebreaks disallowed")
-    result.set_randomized()
-    return random.choice(winners)
+    try:
+        if condorcet_search and (
+            outcome := find_condorcet_outcome(
+                ballots, remaining, seats, quota, required
+            )
+        ):
+            return outcome
+        possible_outcomes = tuple(get_outcomes(remaining, seats, required))
+        if len(possible_outcomes) == 1:
+            return possible_outcomes[0]
+        # Return either a clear winner (no ties), or resolved using MiniMax
+        return get_duels_result(
+            ballots,
+            possible_outcomes,
+            quota,
+            allow_random,
+            result,
+            processes,
+            vectorized,
+            tiebreak,
+        )
+    finally:
+        result.result_extra["duel_cache"] = ballots.cache_stats()
 
 
 class CPO_STV(STVPollBase):
-    def __init__(self, quota=droop_quota, *args, **kwargs):
+    def __init__(
+        self,
+        quota=droop_quota,
+        *args,
+        condorcet_search=True,
+        prune_hopeless=False,
+        prune_required=True,
+        processes=0,
+        duel_cache_size=1024,
+        vectorized=False,
+        tiebreak=CPOTiebreak.Minimax,
+        limits=None,
+        **kwargs,
+    ):
         self.random_in_tiebreaks = kwargs.get("random_in_tiebreaks", True)
+        # Look for an outcome winning all duels, before running all pairwise duels
+        self.condorcet_search = condorcet_search
+        self.prune_hopeless = prune_hopeless
+        self.prune_required = prune_required
+        # Run pairwise duels in a pool of worker processes
+        self.processes = processes
+        # Items in each cache of duel ballots, see DuelBallots
+        self.duel_cache_size = duel_cache_size
+        # Count pairwise duels in batches with NumPy, see DuelMatrix
+        self.vectorized = vectorized
+        # Resolves polls without an outcome winning all duels
+        self.tiebreak = CPOTiebreak(tiebreak)
+        # Estimated cost to refuse, or count with Scottish STV, see CPOLimits
+        self.limits = limits
         kwargs["pedantic_order"] = False
         super().__init__(*args, quota=quota, **kwargs)
 
+    def calculate(self) -> ElectionResult:
+        try:
+            return super().calculate()
+        except CPOLimitExceeded as exceeded:
+            if not self.limits.fallback:
+                raise
+            # Count the same ballots with Scottish STV instead
+            fallback = ScottishSTV(
+                self.seats,
+                self.candidates,
+                self._quota_function,
+                self.random_in_tiebreaks,
+                arithmetic=self.arithmetic,
+                merge_interval=self.merge_interval,
+                bulk_exclusion=self.bulk_exclusion,
+            )
+            fallback.ballots = self.ballots
+            fallback.result.empty_ballot_count = self.result.empty_ballot_count
+            # Keep outcome pruning and other records of the CPO-STV count
+            fallback.result.result_extra.update(self.result.result_extra)
+            self.result = fallback.calculate()
+            self.result.log_cpo_fallback(str(exceeded), exceeded.estimate._asdict())
+            return self.result
+
     def calculate_round(self) -> None:
         """Elect in one round"""
         if len(self.candidates) == self.seats:
@@ -161,108 +1056,99 @@ class CPO_STV(STVPollBase):
         )
 
     def get_best_approval(self) -> Candidates:
-        possible_outcomes = combinations(self.standing_candidates, self.seats_to_fill)
-        duels = tuple(
-            outcomes_duel(
-                # Copy ballots to ensure no manipulation of originals
-                ballots=tuple(
-                    PreferenceBallot(tuple(b), b.count) for b in self.ballots
-                ),
-                compared=combination,
-                quota=self.quota,
-            )
-            for combination in combinations(possible_outcomes, 2)
+        # Duels share ballots, and never change the ones of the poll
+        ballots = DuelBallots.from_ballots(
+            self.ballots, self.candidates, self.duel_cache_size
         )
-
-        # Return either a clear winner (no ties), or resolved using MiniMax
-        return get_duels_winner(duels) or resolve_tie_minimax(
-            duels, self.random_in_tiebreaks, self.result
+        return get_cpo_outcome(
+            ballots,
+            self.standing_candidates,
+            self.seats_to_fill,
+            self.quota,
+            self.current_votes,
+            self.result,
+            allow_random=self.random_in_tiebreaks,
+            condorcet_search=self.condorcet_search,
+            prune_hopeless=self.prune_hopeless,
+            prune_required=self.prune_required,
+            processes=self.processes,
+            vectorized=self.vectorized,
+            tiebreak=self.tiebreak,
+            limits=self.limits,
         )
-        # ... Ranked Pairs (so slow)
-        # return self.get_duels_winner(duels) or self.resolve_tie_ranked_pairs(duels)
-
-    # def resolve_tie_ranked_pairs(self, duels):
-    #     # type: (List[CPOComparisonResult]) -> List[Candidate]
-    #     # https://medium.com/freds-blog/explaining-the-condorcet-system-9b4f47aa4e60
-    #     class TracebackFound(STVException):
-    #         pass
-    #
-    #     def traceback(duel, _trace=None):
-    #         # type: (CPOComparisonResult, CPOComparisonResult) -> None
-    #         for trace in filter(lambda d: d.winner == (_trace and _trace.loser or duel.loser), noncircular_duels):
-    #             if duel.winner == trace.loser:
-    #                 raise TracebackFound()
-    #             traceback(duel, trace)
-    #
-    #     difference_groups = {}
-    #     # filter: Can't declare winners if duel was tied.
-    #     for d in filter(lambda d: not d.tied, duels):
-    #         try:
-    #             difference_groups[d.difference].append(d)
-    #         except KeyError:
-    #             difference_groups[d.difference] = [d]
-    #
-    #     noncircular_duels = []
-    #
-    #     # Check if there are equal difference duels
-    #     # Need to make sure these do not cause tiebreaks depending on order
-    #     for difference in sorted(difference_groups.keys(), reverse=True):
-    #         saved_list = noncircular_duels[:]
-    #         group = difference_groups[difference]
-    #         try:
-    #             for duel in group:
-    #                 traceback(duel)
-    #                 noncircular_duels.append(duel)
-    #         except TracebackFound:
-    #             if len(group) > 1:
-    #                 noncircular_duels = saved_list
-    #                 while group:
-    #                     duel = self.choice(group)
-    #                     try:
-    #                         traceback(duel)
-    #                         noncircular_duels.append(duel)
-    #                     except TracebackFound:
-    #                         pass
-    #                     group.remove(duel)
-    #
-    #     return self.get_duels_winner(noncircular_duels)
 
 
 def calculate_cpo_stv(
     candidates: Candidates,
-    votes: BallotData,
+    votes: BallotData | BallotProfile,
     winners: int,
     *,
     allow_random: bool = True,
     quota_method: Quota = droop_quota,
+    condorcet_search: bool = True,
+    prune_hopeless: bool = False,
+    prune_required: bool = True,
+    processes: int = 0,
+    duel_cache_size: int = 1024,
+    vectorized: bool = False,
+    tiebreak: CPOTiebreak = CPOTiebreak.Minimax,
+    limits: CPOLimits | None = None,
+    arithmetic: Arithmetic | None = None,
+    compact_ballots: bool = False,
 ) -> ElectionResult:
     if winners > len(candidates):
         raise STVException("Not enough candidates")
+    tiebreak = CPOTiebreak(tiebreak)
     result = ElectionResult(candidates=candidates, seats=winners)
-    result.empty_ballot_count, ballots = get_ballots(votes, candidates)
+    result.empty_ballot_count, ballots = get_ballots(
+        votes, candidates, arithmetic, compact_ballots
+    )
     votes = get_votes(ballots, candidates=candidates, standing=set(candidates))
     quota = quota_method(sum((b.count for b in ballots), start=0), winners)
     if len(candidates) == winners:
         result.select(candidates, votes, SelectionMethod.CPO)
     else:
-        possible_outcomes = combinations(candidates, winners)
-        duels = tuple(
-            outcomes_duel(
-                # Copy ballots to ensure no manipulation of originals
-                ballots=tuple(PreferenceBallot(tuple(b), b.count) for b in ballots),
-                compared=combination,
-                quota=quota,
-            )
-            for combination in combinations(possible_outcomes, 2)
-        )
-        # Return either a clear winner (no ties), or resolved using MiniMax
-        # return get_duels_winner(duels) or resolve_tie_minimax(duels)
-        with suppress(IncompleteResult):
-            result.select(
-                get_duels_winner(duels)
-                or resolve_tie_minimax(duels, allow_random, result),
-                votes,
-                SelectionMethod.CPO,
+        duel_ballots = DuelBallots.from_ballots(ballots, candidates, duel_cache_size)
+        try:
+            with suppress(IncompleteResult):
+                result.select(
+                    get_cpo_outcome(
+                        duel_ballots,
+                        candidates,
+                        winners,
+                        quota,
+                        votes,
+                        result,
+                        allow_random=allow_random,
+                        condorcet_search=condorcet_search,
+                        prune_hopeless=prune_hopeless,
+                        prune_required=prune_required,
+                        processes=processes,
+                        vectorized=vectorized,
+                        tiebreak=tiebreak,
+                        limits=limits,
+                    ),
+                    votes,
+                    SelectionMethod.CPO,
+                )
+        except CPOLimitExceeded as exceeded:
+            if not limits.fallback:
+                raise
+            # Count the same ballots with Scottish STV instead
+            fallback = calculate_scottish_stv(
+                candidates,
+                ballots.profile
+                if isinstance(ballots, BallotStore)
+                else [(tuple(ballot), ballot.count) for ballot in ballots],
+                winners,
+                allow_random=allow_random,
+                quota_method=quota_method,
+                arithmetic=arithmetic,
+                compact_ballots=compact_ballots,
             )
+            fallback.empty_ballot_count = result.empty_ballot_count
+            fallback.result_extra = {**result.result_extra, **fallback.result_extra}
+            fallback.log_cpo_fallback(str(exceeded), exceeded.estimate._asdict())
+            return fallback
 
     return result.finalize(quota=quota, tiebreakers=())
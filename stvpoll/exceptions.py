@@ -12,3 +12,10 @@ class BallotException(STVException):
 
 class CandidateDoesNotExist(BallotException):
     pass
+
+
+class CPOLimitExceeded(STVException):
+    def __init__(self, message: str, estimate) -> None:
+        super().__init__(message)
+        # Estimated cost over the limits, a CPOEstimate
+        self.estimate = estimate
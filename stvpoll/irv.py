@@ -1,10 +1,22 @@
+from contextlib import suppress
+
 from .abcs import STVPollBase
-from .base import calculate_stv
+from .arithmetic import Arithmetic, DecimalArithmetic
+from .base import get_ballots, get_bulk_exclusion, intern_ballots
 from .exceptions import IncompleteResult
 from .quotas import Quota
+from .result import ElectionResult
+from .store import BallotProfile
 from .tiebreak_strategies import TiebreakStrategy, TiebreakHistory, TiebreakRandom
 from .transfer_strategies import TransferStrategy, transfer_serial
-from .types import BallotData, Candidates, SelectionMethod
+from .types import (
+    BallotData,
+    Candidate,
+    Candidates,
+    CandidateStatus,
+    SelectionMethod,
+    VoteTransfers,
+)
 
 
 def irv_quota(ballot_count: int, winners: int) -> int:
@@ -28,30 +40,59 @@ class IRV(STVPollBase):
 
     def calculate_round(self) -> None:
         # First, check if there is a winner
-        for proposal in self.standing_candidates:
-            if self.get_current_votes(proposal) >= self.quota:
-                self.elect(proposal, SelectionMethod.Direct)
-                return
+        votes = self.current_votes
+        leader = max(votes, key=votes.__getitem__)
+        if votes[leader] >= self.quota:
+            self.elect(leader, SelectionMethod.Direct)
+            return
 
-        if len(self.standing_candidates) == 1:
+        if len(votes) == 1:
             raise IncompleteResult("No candidate can get majority.")
 
-        # Exclude one candidate
-        candidate, method = self.get_candidate(most_votes=False)
-        self.exclude(candidate, method)
-        self.transfer_votes(candidate)
+        # Exclude all trailing candidates, or one candidate
+        if not self.bulk_exclude():
+            candidate, method = self.get_candidate(most_votes=False)
+            self.exclude(candidate, method)
+            self.transfer_votes(candidate)
 
 
 def calculate_irv(
     candidates: Candidates,
-    ballots: BallotData,
+    ballots: BallotData | BallotProfile,
     *,
     allow_random: bool = True,
     random_shuffle: bool = True,
     tiebreak_strategies: tuple[TiebreakStrategy, ...] = None,
     transfer_strategy: TransferStrategy = transfer_serial,
     quota_method: Quota = irv_quota,
-):
+    arithmetic: Arithmetic | None = None,
+    merge_interval: int = 0,
+    compact_ballots: bool = False,
+    bulk_exclusion: bool = False,
+) -> ElectionResult:
+    """
+    Instant runoff count, with a single winner.
+    Keeps a running tally with the current leader, and stops as soon as the leader
+    reaches quota. Votes of the winner are not transferred.
+    :param candidates: All candidates - ballots may not have other candidates
+    :param ballots: All ballots, with count for each ballot, or a shared BallotProfile
+    :param allow_random: Use random tiebreaking mechanism (recommended)
+    :param random_shuffle: If False: Use incoming candidate order instead of shuffling
+    :param tiebreak_strategies: Allows overriding tiebreak strategies
+    :param transfer_strategy: Defaults to serial transfer
+    :param quota_method: Defaults to irv_quota
+    :param arithmetic: Arithmetic for ballot weights, such as FixedPoint. Defaults to Decimal.
+    :param merge_interval: Merge equivalent ballots each time this many candidates have left
+    :param compact_ballots: Keep ballots in a BallotStore, to save memory on large polls
+    :param bulk_exclusion: Exclude all trailing candidates below the next candidate at once,
+                           unless their votes could give a candidate majority
+    :return: Election result
+    >>> result = calculate_irv(
+    ...     ('A', 'B', 'C'), {('A',): 4, ('B', 'A'): 2, ('C', 'B'): 3}, allow_random=False
+    ... )
+    >>> result.elected_as_tuple(), [r.selected for r in result.rounds]
+    (('A',), [('B',), ('A',)])
+    """
     if tiebreak_strategies is None:
         tiebreak_strategies = (
             (
@@ -61,12 +102,82 @@ def calculate_irv(
             if allow_random
             else (TiebreakHistory(),)
         )
-    return calculate_stv(
-        candidates,
-        ballots,
-        1,
-        elect_last_standing=False,
-        tiebreak_strategies=tiebreak_strategies,
-        transfer_strategy=transfer_strategy,
-        quota_method=quota_method,
+    result = ElectionResult(candidates=candidates, seats=1)
+    arithmetic = arithmetic or DecimalArithmetic()
+    # Count with candidate indexes, mapping back to candidates in result
+    names = candidates
+    candidates = tuple(range(len(names)))
+    result.empty_ballot_count, ballots = get_ballots(
+        intern_ballots(ballots, names), candidates, arithmetic, compact_ballots
     )
+    quota = quota_method(sum((b.count for b in ballots), start=0), 1)
+    piles = arithmetic.piles(ballots, candidates)
+    votes = piles.get_votes(candidates)
+    leader = max(votes, key=votes.__getitem__, default=None)
+    merged_standing = len(candidates)
+
+    def select(
+        selected: Candidates,
+        method: SelectionMethod,
+        status: CandidateStatus = CandidateStatus.Elected,
+    ) -> None:
+        result.select(
+            tuple(names[c] for c in selected),
+            {names[c]: v for c, v in votes.items()},
+            method,
+            status,
+        )
+
+    def resolve_tiebreak(tied: Candidates) -> tuple[Candidate, SelectionMethod]:
+        history = tuple(r.votes for r in result.rounds)
+        tied = tuple(names[c] for c in tied)
+        for tiebreaker in tiebreak_strategies:
+            tied = tiebreaker.resolve(tied, history, lowest=True)
+            if not isinstance(tied, tuple):
+                return names.index(tied), tiebreaker.method
+        raise IncompleteResult("Could not break tie")
+
+    with suppress(IncompleteResult):
+        while votes:
+            if votes[leader] >= quota:
+                select((leader,), SelectionMethod.Direct)
+                break
+
+            if bulk_exclusion and (excluded := get_bulk_exclusion(votes, quota, 1)):
+                method = SelectionMethod.BulkExclusion
+            else:
+                min_votes = min(votes.values())
+                excluded = tuple(c for c, v in votes.items() if v == min_votes)
+                if len(excluded) == 1:
+                    method = SelectionMethod.Direct
+                else:
+                    candidate, method = resolve_tiebreak(excluded)
+                    excluded = (candidate,)
+            for candidate in excluded:
+                select((candidate,), method, CandidateStatus.Excluded)
+
+            log, exhausted, votes = transfer_strategy(
+                ballots=piles,
+                quota=quota,
+                decrease_value=False,
+                transfers=excluded,
+                vote_count=votes,
+                standing=tuple(c for c in votes if c not in excluded),
+            )
+            result.exhausted += exhausted
+            result.transfer_log.append(
+                VoteTransfers({(names[a], names[b]): v for (a, b), v in log.items()})
+            )
+            # Only candidates receiving votes can overtake the leader
+            if leader in votes:
+                receiving = (b for _, b in log if b in votes)
+                leader = max((leader, *receiving), key=votes.__getitem__)
+            else:
+                leader = max(votes, key=votes.__getitem__, default=None)
+            if merge_interval and merged_standing - len(votes) >= merge_interval:
+                ballot_count = len(piles)
+                piles.merge()
+                result.log_ballot_merge(ballot_count, len(piles))
+                merged_standing = len(votes)
+
+    return result.finalize(tiebreakers=tiebreak_strategies, quota=quota)
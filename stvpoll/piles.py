@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from itertools import islice
+from typing import Iterable, Iterator, TYPE_CHECKING
+
+from stvpoll.types import Candidate, Candidates, Votes
+
+if TYPE_CHECKING:  # pragma: no coverage
+    from decimal import Decimal
+
+    from stvpoll.arithmetic import Arithmetic
+    from stvpoll.ballots import PreferenceBallot
+
+
+class BallotPiles:
+    """
+    Index of ballots by current preference, one pile per standing candidate.
+    Transfer strategies read the piles of transferred candidates directly,
+    instead of scanning all ballots, and put ballots on their new pile.
+    Iterating piles yields all ballots that are not exhausted.
+    Ballot weights are summed using arithmetic of the ballots.
+    """
+
+    piles: dict[Candidate, list[PreferenceBallot]]
+
+    def __init__(
+        self,
+        ballots: Iterable[PreferenceBallot],
+        standing: Iterable[Candidate],
+        arithmetic: Arithmetic,
+    ) -> None:
+        self.ballots = tuple(ballots)
+        self.piles = {c: [] for c in standing}
+        self.arithmetic = arithmetic
+        self.stack(self.ballots)
+
+    def __iter__(self) -> Iterator[PreferenceBallot]:
+        for pile in self.piles.values():
+            yield from pile
+
+    def __len__(self) -> int:
+        return sum(map(len, self.piles.values()))
+
+    def __getitem__(self, candidate: Candidate) -> list[PreferenceBallot]:
+        return self.piles[candidate]
+
+    def __contains__(self, candidate: Candidate) -> bool:
+        return candidate in self.piles
+
+    def pop(self, candidate: Candidate) -> list[PreferenceBallot]:
+        """Remove pile of a candidate that is no longer standing."""
+        return self.piles.pop(candidate)
+
+    def pop_transfers(
+        self, transfers: Candidates
+    ) -> list[tuple[PreferenceBallot, Candidate]]:
+        """Remove piles of transferred candidates, returning ballots with their candidate."""
+        return [
+            (ballot, candidate)
+            for candidate in transfers
+            for ballot in self.pop(candidate)
+        ]
+
+    def stack(self, ballots: Iterable[PreferenceBallot]) -> None:
+        """Put ballots on the pile of their current preference, skipping exhausted."""
+        piles = self.piles
+        for ballot in ballots:
+            if (candidate := ballot.advance(piles)) is not None:
+                piles[candidate].append(ballot)
+
+    def merge(self) -> None:
+        """
+        Merge ballots in each pile with the same remaining standing preferences and multiplier.
+        Merged ballots transfer exactly as the ballots in them would, since candidates
+        that are no longer standing never affect transfers.
+        >>> from stvpoll.arithmetic import DecimalArithmetic
+        >>> arithmetic = DecimalArithmetic()
+        >>> ballots = [arithmetic.ballot(p, 1) for p in ('ABC', 'ACB', 'BC', 'C')]
+        >>> piles = BallotPiles(ballots, 'BC', arithmetic)
+        >>> piles.merge()
+        >>> piles['B'], piles['C']
+        ([PreferenceBallot([B,C], 2)], [PreferenceBallot([A,C,B], 1), PreferenceBallot([C], 1)])
+        """
+        piles = self.piles
+        standing = piles.__contains__
+        for candidate, pile in piles.items():
+            groups: dict[tuple, list[PreferenceBallot]] = defaultdict(list)
+            for ballot in pile:
+                groups[
+                    tuple(filter(standing, islice(ballot, ballot.position, None))),
+                    ballot.multiplier,
+                ].append(ballot)
+            if len(groups) < len(pile):
+                piles[candidate] = [
+                    self._merge(preferences, multiplier, group)
+                    for (preferences, multiplier), group in groups.items()
+                ]
+        self.ballots = tuple(self)
+
+    def _merge(
+        self,
+        preferences: Candidates,
+        multiplier: Decimal,
+        ballots: list[PreferenceBallot],
+    ) -> PreferenceBallot:
+        if len(ballots) == 1:
+            return ballots[0]
+        ballot = self.arithmetic.ballot(preferences, sum(b.count for b in ballots))
+        ballot.multiplier = multiplier
+        return ballot
+
+    def get_votes(self, candidates: Candidates) -> Votes:
+        """
+        Count piles of standing candidates, in candidate order.
+        >>> from stvpoll.arithmetic import DecimalArithmetic
+        >>> arithmetic = DecimalArithmetic()
+        >>> ballots = (arithmetic.ballot((1, 2), 2), arithmetic.ballot((2,), 1))
+        >>> piles = BallotPiles(ballots, (2, 3), arithmetic)
+        >>> piles.get_votes((1, 2, 3))
+        {2: Decimal('3'), 3: Decimal('0')}
+        """
+        arithmetic = self.arithmetic
+        return {
+            c: arithmetic.to_decimal(
+                sum((b.weight for b in self.piles[c]), start=arithmetic.zero)
+            )
+            for c in candidates
+            if c in self.piles
+        }
+
+    def recount(self, candidates: Candidates) -> Votes:
+        """Count all ballots again, without using the piles."""
+        arithmetic = self.arithmetic
+        votes = {c: arithmetic.zero for c in candidates if c in self.piles}
+        for ballot in self.ballots:
+            if (candidate := ballot.advance(votes)) is not None:
+                votes[candidate] += ballot.weight
+        return {c: arithmetic.to_decimal(v) for c, v in votes.items()}
+
+
+class BallotNode:
+    """Node in a prefix tree of ballots, counting all ballots through it."""
+
+    __slots__ = ("count", "ending", "children")
+
+    def __init__(self) -> None:
+        self.count = 0
+        # Ballots with no further preferences
+        self.ending = 0
+        self.children: dict[Candidate, BallotNode] = {}
+
+
+class BallotTrie(BallotPiles):
+    """
+    Ballot piles where ballots sharing leading preferences are aggregated in a prefix tree.
+    A pile entry is a ballot for a whole subtree, with the preferences leading to it and
+    the count of all ballots below. Ballots in a subtree always share multiplier,
+    since they have been transferred through the same candidates.
+    When a pile is transferred, entries are split into subtrees of the next standing
+    candidates, splicing out nodes of candidates that are no longer standing.
+    >>> from stvpoll.arithmetic import DecimalArithmetic
+    >>> arithmetic = DecimalArithmetic(index=BallotTrie)
+    >>> ballots = [arithmetic.ballot(p, 1) for p in ('ABC', 'ABD', 'AB', 'AC', 'B')]
+    >>> piles = arithmetic.piles(ballots, 'ABCD')
+    >>> piles['A']
+    [PreferenceBallot([A], 4)]
+    >>> piles.pop_transfers(('A',))
+    [(PreferenceBallot([A,B], 3), 'A'), (PreferenceBallot([A,C], 1), 'A')]
+    """
+
+    def __init__(
+        self,
+        ballots: Iterable[PreferenceBallot],
+        standing: Iterable[Candidate],
+        arithmetic: Arithmetic,
+    ) -> None:
+        self.root = BallotNode()
+        for ballot in ballots:
+            node = self.root
+            node.count += ballot.count
+            for candidate in ballot:
+                if (child := node.children.get(candidate)) is None:
+                    child = node.children[candidate] = BallotNode()
+                node = child
+                node.count += ballot.count
+            node.ending += ballot.count
+        self.piles = {c: [] for c in standing}
+        self.arithmetic = arithmetic
+        self.stack(self._split(arithmetic.ballot((), self.root.count)))
+
+    @property
+    def ballots(self) -> tuple[PreferenceBallot, ...]:
+        """Entries of all ballots that are not exhausted, recounted by recount()."""
+        return tuple(self)
+
+    def _split(self, entry: PreferenceBallot) -> Iterator[PreferenceBallot]:
+        """Split entry into subtrees of the next standing candidates, and ending ballots."""
+        node = self.root
+        for candidate in entry:
+            node = node.children[candidate]
+        yield from self._iter_subtrees(entry, list(entry), node)
+
+    def _iter_subtrees(
+        self, entry: PreferenceBallot, preferences: list[Candidate], node: BallotNode
+    ) -> Iterator[PreferenceBallot]:
+        if node.ending:
+            yield self._make_entry(entry, preferences, node.ending)
+        for candidate, child in node.children.items():
+            if candidate in self.piles:
+                yield self._make_entry(entry, preferences + [candidate], child.count)
+            else:
+                yield from self._iter_subtrees(entry, preferences + [candidate], child)
+
+    def _make_entry(
+        self, entry: PreferenceBallot, preferences: list[Candidate], count: int
+    ) -> PreferenceBallot:
+        if len(preferences) == len(entry) and count == entry.count:
+            return entry
+        ballot = self.arithmetic.ballot(preferences, count)
+        ballot.multiplier = entry.multiplier
+        ballot.position = entry.position
+        return ballot
+
+    def merge(self) -> None:
+        """Entries are already aggregated, and must stay whole subtrees."""
+
+    def pop_transfers(
+        self, transfers: Candidates
+    ) -> list[tuple[PreferenceBallot, Candidate]]:
+        transferable = super().pop_transfers(transfers)
+        return [
+            (ballot, candidate)
+            for entry, candidate in transferable
+            for ballot in self._split(entry)
+        ]
@@ -52,6 +52,8 @@ class ElectionResult(list[Candidate]):
         super().__init__()
         self.candidates = candidates
         self.rounds = []
+        # Candidates selected in any round, to look up standing candidates
+        self._selected = set[Candidate]()
         self.seats = seats
         self.start_time = time()
         self.result_extra = {}
@@ -94,11 +96,42 @@ class ElectionResult(list[Candidate]):
                 votes=votes,
             )
         )
+        self._selected.update(candidates)
         if status == CandidateStatus.Elected:
             self.extend(candidates)
 
+    def log_ballot_merge(self, ballots: int, merged: int) -> None:
+        """Record number of ballots before and after merging equivalent ballots."""
+        self.result_extra.setdefault("ballot_merges", []).append(
+            {"round": len(self.rounds), "ballots": ballots, "merged": merged}
+        )
+
+    def log_outcome_pruning(
+        self,
+        required: Candidates,
+        excluded: Candidates,
+        outcomes: int,
+        remaining: int,
+    ) -> None:
+        """Record candidates required in or left out of all possible outcomes, if any."""
+        if required or excluded:
+            self.result_extra["outcome_pruning"] = {
+                "required": required,
+                "excluded": excluded,
+                "outcomes": outcomes,
+                "remaining": remaining,
+            }
+
+    def log_cpo_fallback(self, reason: str, estimate: dict) -> None:
+        """Record that a CPO-STV count over its limits was counted with Scottish STV."""
+        self.result_extra["cpo_fallback"] = {
+            "method": "Scottish STV",
+            "reason": reason,
+            "estimate": estimate,
+        }
+
     def still_standing(self, candidate: Candidate) -> bool:
-        return all(candidate not in r.selected for r in self.rounds)
+        return candidate not in self._selected
 
     @property
     def complete(self) -> bool:
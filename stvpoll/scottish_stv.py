@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 from stvpoll.abcs import STVPollBase
+from stvpoll.arithmetic import Arithmetic
 from stvpoll.base import calculate_stv
 from stvpoll.quotas import droop_quota, Quota
 from stvpoll.result import ElectionResult
+from stvpoll.store import BallotProfile
 from stvpoll.tiebreak_strategies import (
     TiebreakHistory,
     TiebreakRandom,
@@ -21,8 +23,22 @@ class ScottishSTV(STVPollBase):
         quota=droop_quota,
         random_in_tiebreaks=True,
         pedantic_order=False,
+        arithmetic: Arithmetic | None = None,
+        merge_interval: int = 0,
+        compact_ballots: bool = False,
+        bulk_exclusion: bool = False,
     ):
-        super().__init__(seats, candidates, quota, random_in_tiebreaks, pedantic_order)
+        super().__init__(
+            seats,
+            candidates,
+            quota,
+            random_in_tiebreaks,
+            pedantic_order,
+            arithmetic,
+            merge_interval,
+            compact_ballots,
+            bulk_exclusion,
+        )
 
     def calculate_round(self) -> None:
         # First, declare winners if any are over quota
@@ -44,8 +60,8 @@ class ScottishSTV(STVPollBase):
                 SelectionMethod.NoCompetition,
             )
 
-        # Else exclude a candidate
-        else:
+        # Else exclude all hopeless candidates, or a single candidate
+        elif not self.bulk_exclude():
             candidate, method = self.get_candidate(most_votes=False)
             self.exclude(candidate, method)
             self.transfer_votes(candidate)
@@ -53,7 +69,7 @@ class ScottishSTV(STVPollBase):
 
 def calculate_scottish_stv(
     candidates: Candidates,
-    ballots: BallotData,
+    ballots: BallotData | BallotProfile,
     winners: int,
     *,
     allow_random: bool = True,
@@ -62,10 +78,14 @@ def calculate_scottish_stv(
     tiebreak_strategies: tuple[TiebreakStrategy, ...] = None,
     transfer_strategy: TransferStrategy = transfer_serial,
     quota_method: Quota = droop_quota,
+    arithmetic: Arithmetic | None = None,
+    merge_interval: int = 0,
+    compact_ballots: bool = False,
+    bulk_exclusion: bool = False,
 ) -> ElectionResult:
     """
     :param candidates: All candidates - ballots may not have other candidates
-    :param ballots: All ballots, with count for each ballot
+    :param ballots: All ballots, with count for each ballot, or a shared BallotProfile
     :param winners: Number of winners
     :param allow_random: Use random tiebreaking mechanism (recommended)
     :param pedantic_order: Use tiebreaking mechanism for election order of candidates above quota
@@ -73,6 +93,10 @@ def calculate_scottish_stv(
     :param tiebreak_strategies: Allows overriding tiebreak strategies
     :param transfer_strategy: Defaults to serial transfer
     :param quota_method: Defaults to droop_quota
+    :param arithmetic: Arithmetic for ballot weights, such as FixedPoint. Defaults to Decimal.
+    :param merge_interval: Merge equivalent ballots each time this many candidates have left
+    :param compact_ballots: Keep ballots in a BallotStore, to save memory on large polls
+    :param bulk_exclusion: Exclude all hopeless lowest candidates at once
     :return: Election result
     """
     if tiebreak_strategies is None:
@@ -92,4 +116,8 @@ def calculate_scottish_stv(
         pedantic_order=pedantic_order,
         quota_method=quota_method,
         tiebreak_strategies=tiebreak_strategies,
+        arithmetic=arithmetic,
+        merge_interval=merge_interval,
+        compact_ballots=compact_ballots,
+        bulk_exclusion=bulk_exclusion,
     )
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+from array import array
+from decimal import Decimal
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Iterable, Iterator
+
+from stvpoll.arithmetic import (
+    Arithmetic,
+    DecimalArithmetic,
+    FixedPoint,
+    FixedPointBallot,
+)
+from stvpoll.ballots import PreferenceBallot
+from stvpoll.exceptions import STVException
+from stvpoll.types import Candidate
+
+
+class StoredBallot:
+    """
+    View of a ballot in a BallotStore, with the PreferenceBallot API.
+    Views only hold store and row, so they are cheap to create and any number of
+    views of the same row share count, multiplier and cursor position.
+    """
+
+    __slots__ = ("store", "row")
+
+    def __init__(self, store: BallotStore, row: int) -> None:
+        self.store = store
+        self.row = row
+
+    def __iter__(self) -> Iterator[Candidate]:
+        store = self.store
+        offsets = store.offsets
+        return map(
+            store.candidates.__getitem__,
+            store.preferences[offsets[self.row] : offsets[self.row + 1]],
+        )
+
+    def __len__(self) -> int:
+        return self.store.offsets[self.row + 1] - self.store.offsets[self.row]
+
+    def __getitem__(self, index: int) -> Candidate:
+        store = self.store
+        offsets = store.offsets
+        return store.candidates[
+            store.preferences[offsets[self.row] : offsets[self.row + 1]][index]
+        ]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, StoredBallot):
+            return self.store is other.store and self.row == other.row
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((id(self.store), self.row))
+
+    @property
+    def count(self) -> int:
+        return self.store.counts[self.row]
+
+    @property
+    def position(self) -> int:
+        return self.store.positions[self.row]
+
+    @position.setter
+    def position(self, value: int) -> None:
+        self.store.positions[self.row] = value
+
+    @property
+    def multiplier(self) -> Decimal:
+        return self.store.multipliers[self.row]
+
+    @multiplier.setter
+    def multiplier(self, value: Decimal) -> None:
+        self.store.multipliers[self.row] = value
+
+    @property
+    def round(self) -> Callable[[Decimal], Decimal]:
+        return self.store.arithmetic.rounding
+
+    value = PreferenceBallot.value
+    weight = PreferenceBallot.weight
+    decrease_value = PreferenceBallot.decrease_value
+    get_next_preference = PreferenceBallot.get_next_preference
+    advance = PreferenceBallot.advance
+    is_current_candidate = PreferenceBallot.is_current_candidate
+
+    def __repr__(self) -> str:
+        return f"StoredBallot([{','.join(map(str, self))}], {self.count})"
+
+
+class StoredFixedPointBallot(StoredBallot):
+    """View of a ballot in a BallotStore, with the FixedPointBallot API."""
+
+    __slots__ = ()
+
+    @property
+    def units(self) -> int:
+        return self.store.multipliers[self.row]
+
+    @units.setter
+    def units(self, value: int) -> None:
+        self.store.multipliers[self.row] = value
+
+    @property
+    def arithmetic(self) -> FixedPoint:
+        return self.store.arithmetic
+
+    multiplier = FixedPointBallot.multiplier
+    value = FixedPointBallot.value
+    weight = FixedPointBallot.weight
+    decrease_value = FixedPointBallot.decrease_value
+
+
+class BallotProfile:
+    """
+    Ballot preferences and counts, shared by any number of counts.
+    Preferences of all ballots are one flat array of candidate indexes, where
+    offsets[row] to offsets[row + 1] are the preferences of a ballot.
+    Counting never changes a profile. Weights and cursor positions of a count are
+    kept in a BallotStore over the profile.
+    >>> profile = BallotProfile(('A', 'B', 'C'))
+    >>> profile.add(('B', 'A'), 2)
+    >>> profile.add((), 3)
+    >>> profile.add(('C',), 1)
+    >>> profile.preferences, profile.offsets, profile.counts, profile.empty_ballot_count
+    (array('i', [1, 0, 2]), array('q', [0, 2, 3]), array('q', [2, 1]), 3)
+    """
+
+    def __init__(self, candidates: Iterable[Candidate]) -> None:
+        self.candidates = tuple(candidates)
+        self.index = {c: i for i, c in enumerate(self.candidates)}
+        self.preferences = array("i")
+        self.offsets = array("q", (0,))
+        self.counts = array("q")
+        self.empty_ballot_count = 0
+
+    def add(self, preferences: Iterable[Candidate], count: int) -> None:
+        """Add ballot, or count it as empty. Only while no count uses the profile."""
+        try:
+            self.preferences.extend(map(self.index.__getitem__, preferences))
+        except KeyError as missing:
+            del self.preferences[self.offsets[-1] :]
+            raise STVException(
+                f"Candidate {missing} not in candidates: {preferences}"
+            ) from None
+        if len(self.preferences) == self.offsets[-1]:
+            self.empty_ballot_count += count
+            return
+        self.offsets.append(len(self.preferences))
+        self.counts.append(count)
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def share(self) -> SharedMemory:
+        """
+        Copy of offsets, counts and preferences in a new block of shared memory, for
+        other processes to attach. Close and unlink the block when done.
+        >>> profile = BallotProfile(('A', 'B'))
+        >>> profile.add(('B', 'A'), 2)
+        >>> memory = profile.share()
+        >>> shared = BallotProfile.attach(profile.candidates, memory.name, len(profile))
+        >>> list(shared.preferences), list(shared.counts)
+        ([1, 0], [2])
+        >>> shared.release()
+        >>> memory.close(), memory.unlink()
+        (None, None)
+        """
+        arrays = (self.offsets, self.counts, self.preferences)
+        memory = SharedMemory(
+            create=True, size=sum(a.itemsize * len(a) for a in arrays)
+        )
+        start = 0
+        for a in arrays:
+            data = a.tobytes()
+            memory.buf[start : start + len(data)] = data
+            start += len(data)
+        return memory
+
+    @classmethod
+    def attach(
+        cls, candidates: Iterable[Candidate], name: str, ballots: int
+    ) -> BallotProfile:
+        """
+        Profile of ballots in shared memory from share(), reading arrays in place.
+        Call release() before the process closes the memory.
+        """
+        profile = cls(candidates)
+        profile.memory = SharedMemory(name)
+        buffer = profile.memory.buf
+        offsets_end = profile.offsets.itemsize * (ballots + 1)
+        profile.offsets = buffer[:offsets_end].cast(profile.offsets.typecode)
+        counts_end = offsets_end + profile.counts.itemsize * ballots
+        profile.counts = buffer[offsets_end:counts_end].cast(profile.counts.typecode)
+        profile.preferences = buffer[
+            counts_end : counts_end + profile.preferences.itemsize * profile.offsets[-1]
+        ].cast(profile.preferences.typecode)
+        return profile
+
+    def release(self) -> None:
+        """Release arrays of an attached profile, and close the shared memory."""
+        for view in (self.offsets, self.counts, self.preferences):
+            view.release()
+        self.memory.close()
+
+
+class BallotStore:
+    """
+    Compact ballot store for a count, with columns of ballots in arrays instead of one
+    list per ballot. Preferences and counts are in a BallotProfile, that may be shared.
+    Multipliers and cursor positions of the count are arrays with one item per ballot.
+    Multipliers are integer units with FixedPoint arithmetic, otherwise Decimal.
+    Ballots are views, so transfer strategies and indexes work as with other ballots.
+    Candidates name candidate indexes of the profile, defaulting to profile candidates.
+    >>> store = BallotStore(('A', 'B', 'C'))
+    >>> store.add(('B', 'A'), 2)
+    >>> store.add(('C',), 1)
+    >>> list(store)
+    [StoredBallot([B,A], 2), StoredBallot([C], 1)]
+    >>> store[0].advance(('A', 'C'))
+    'A'
+    >>> store.positions, store.new_count().positions
+    (array('i', [1, 0]), array('i', [0, 0]))
+    """
+
+    def __init__(
+        self,
+        profile: BallotProfile | Iterable[Candidate],
+        arithmetic: Arithmetic | None = None,
+        candidates: Iterable[Candidate] | None = None,
+    ) -> None:
+        if not isinstance(profile, BallotProfile):
+            profile = BallotProfile(profile)
+        self.profile = profile
+        self.candidates = (
+            profile.candidates if candidates is None else tuple(candidates)
+        )
+        self.arithmetic = arithmetic or DecimalArithmetic()
+        # Arrays of the profile, only extended in place
+        self.preferences = profile.preferences
+        self.offsets = profile.offsets
+        self.counts = profile.counts
+        self.positions = array("i", (0,)) * len(profile)
+        if isinstance(self.arithmetic, FixedPoint):
+            self.view = StoredFixedPointBallot
+            self.whole = self.arithmetic.unit
+            self.multipliers = array("q", (self.whole,)) * len(profile)
+        else:
+            self.view = StoredBallot
+            self.whole = Decimal(1)
+            self.multipliers = [self.whole] * len(profile)
+
+    def new_count(self) -> BallotStore:
+        """Store for another count of the same ballots, with initial weights and positions."""
+        return BallotStore(self.profile, self.arithmetic, self.candidates)
+
+    def add(self, preferences: Iterable[Candidate], count: int) -> None:
+        """Add ballot to profile. Empty ballots are only counted in the profile."""
+        self.profile.add(preferences, count)
+        while len(self.positions) < len(self.profile):
+            self.positions.append(0)
+            self.multipliers.append(self.whole)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __getitem__(self, row: int) -> StoredBallot:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return self.view(self, row)
+
+    def __iter__(self) -> Iterator[StoredBallot]:
+        return (self.view(self, row) for row in range(len(self)))
@@ -1,16 +1,24 @@
 from __future__ import annotations
 
 from decimal import Decimal
+from itertools import islice
+import sys
 from typing import Iterator, TYPE_CHECKING, Protocol, Iterable
 
+from stvpoll.arithmetic import Arithmetic, DecimalArithmetic
+from stvpoll.piles import BallotPiles
 from stvpoll.types import Candidates, Candidate, Votes, VoteTransfers
 
 if TYPE_CHECKING:  # pragma: no coverage
-    from stvpoll.abcs import PreferenceBallot
+    from stvpoll.ballots import PreferenceBallot
 
 
 class TransferStrategy(Protocol):
-    """Transfer votes, returning vote transfer mapping, exhausted votes and resulting Votes"""
+    """
+    Transfer votes, returning vote transfer mapping, exhausted votes and resulting Votes.
+    Ballots may be BallotPiles, that should be kept up to date with transferred ballots.
+    Ballots in a RankMatrix are transferred by its vectorized version of the strategy.
+    """
 
     def __call__(
         self,
@@ -24,17 +32,51 @@ class TransferStrategy(Protocol):
         ...
 
 
+def _get_arithmetic(ballots: Iterable[PreferenceBallot]) -> Arithmetic:
+    if isinstance(ballots, BallotPiles):
+        return ballots.arithmetic
+    return DecimalArithmetic()
+
+
+def _is_rank_matrix(ballots: Iterable[PreferenceBallot]) -> bool:
+    """
+    Ballots in a RankMatrix, only checked if stvpoll.vectorized has been imported,
+    as it must have been to create one. So NumPy is only imported for vectorized counts.
+    """
+    vectorized = sys.modules.get("stvpoll.vectorized")
+    return vectorized is not None and isinstance(ballots, vectorized.RankMatrix)
+
+
+def _to_decimal(arithmetic: Arithmetic, transfer_log: VoteTransfers) -> VoteTransfers:
+    return VoteTransfers(
+        {key: arithmetic.to_decimal(weight) for key, weight in transfer_log.items()}
+    )
+
+
 def _iter_transferable_ballots(
     ballots: Iterable[PreferenceBallot],
     transfers: Candidates,
     standing: Candidates,
 ) -> Iterator[tuple[PreferenceBallot, Candidate]]:
+    """Yields ballots where a transferred candidate is current preference, moving ballot cursors."""
+    if isinstance(ballots, BallotPiles):
+        yield from ballots.pop_transfers(transfers)
+        return
+    candidates = {*transfers, *standing}
     for ballot in ballots:
-        current_preference = ballot.get_next_preference(transfers + standing)
+        current_preference = ballot.advance(candidates)
         if current_preference in transfers:
             yield ballot, current_preference
 
 
+def _restack(
+    ballots: Iterable[PreferenceBallot], transferred: Iterable[PreferenceBallot]
+) -> None:
+    """Put transferred ballots on their new piles, if ballots are kept in piles."""
+    if isinstance(ballots, BallotPiles):
+        ballots.stack(transferred)
+
+
 # Currently not used in STVPoll
 def transfer_all(
     ballots: Iterable[PreferenceBallot],
@@ -48,25 +90,32 @@ def transfer_all(
     Transfer votes for list of candidates or a single candidate.
     If candidate was elected, set decrease_value to True.
     """
+    if _is_rank_matrix(ballots):
+        return ballots.transfer_all(
+            vote_count, transfers, standing, quota, decrease_value
+        )
+    arithmetic = _get_arithmetic(ballots)
     transfer_log = VoteTransfers()
-    exhausted = Decimal(0)
+    exhausted = arithmetic.zero
+    transferable = tuple(_iter_transferable_ballots(ballots, transfers, standing))
 
     # Go through each transferable ballot (where a candidate is current preference)
-    for ballot, candidate in _iter_transferable_ballots(ballots, transfers, standing):
+    for ballot, candidate in transferable:
         if decrease_value:
-            votes = vote_count[candidate]
-            transfer_quota = (votes - quota) / votes
+            transfer_quota = arithmetic.get_transfer_quota(vote_count[candidate], quota)
             ballot.decrease_value(transfer_quota)
 
-        if target_candidate := ballot.get_next_preference(standing):
-            transfer_log[(candidate, target_candidate)] += ballot.value
+        if (target_candidate := ballot.get_next_preference(standing)) is not None:
+            transfer_log[(candidate, target_candidate)] += ballot.weight
         else:
-            exhausted += ballot.value
+            exhausted += ballot.weight
+    _restack(ballots, (ballot for ballot, _ in transferable))
+    transfer_log = _to_decimal(arithmetic, transfer_log)
 
     # Return a completely new current votes dictionary, with new vote values and w/o transferred candidates.
     return (
         transfer_log,
-        exhausted,
+        arithmetic.to_decimal(exhausted),
         {
             candidate: vote_count[candidate]
             + sum(transfer_log[(_from, candidate)] for _from in transfers)
@@ -75,6 +124,44 @@ def transfer_all(
     )
 
 
+def _get_serial_batches(
+    ballots: Iterable[PreferenceBallot], transfers: Candidates, standing: Candidates
+) -> list[list[tuple[PreferenceBallot, Candidate | None]]]:
+    """
+    Ballots each candidate transfers, with their target, in one pass over ballots.
+    Candidates transfer in order. A candidate transfers the ballots where it comes
+    before all standing candidates, to the first candidate that is standing or later in
+    order. So a ballot may be transferred by several candidates.
+    >>> from stvpoll.ballots import PreferenceBallot
+    >>> ballot = PreferenceBallot(('Y', 'X', 'Z'), 1)
+    >>> _get_serial_batches((ballot,), ('X', 'Y'), ('Z',))
+    [[(PreferenceBallot([Y,X,Z], 1), 'Y')], [(PreferenceBallot([Y,X,Z], 1), 'Z')]]
+    """
+    order = {c: i for i, c in enumerate(transfers)}
+    standing = set(standing)
+    batches = [[] for _ in transfers]
+    for ballot in ballots:
+        # Transferred candidates before first standing candidate, in ballot order
+        queued = []
+        target = None
+        for preference in islice(ballot, ballot.position, None):
+            if preference in standing:
+                target = preference
+                break
+            if (index := order.get(preference)) is not None and index not in queued:
+                queued.append(index)
+        for index in queued:
+            batches[index].append(
+                (
+                    ballot,
+                    next(
+                        (transfers[later] for later in queued if later > index), target
+                    ),
+                )
+            )
+    return batches
+
+
 def transfer_serial(
     ballots: Iterable[PreferenceBallot],
     vote_count: Votes,
@@ -88,35 +175,40 @@ def transfer_serial(
     If candidate was elected, ballot value should probably be decreased.
     Will generate new current_votes dictionary.
     """
+    if _is_rank_matrix(ballots):
+        return ballots.transfer_serial(
+            vote_count, transfers, standing, quota, decrease_value
+        )
+    arithmetic = _get_arithmetic(ballots)
     transfer_log = VoteTransfers()
-    exhausted = Decimal(0)
-
-    # We need to know which candidates are still to be transferred
-    transfer_queue = list(transfers)
-    while transfer_queue:
-        candidate = transfer_queue.pop(0)
-        votes = vote_count[candidate]
-        transfer_quota = (votes - quota) / votes if decrease_value else Decimal(1)
+    exhausted = arithmetic.zero
+    # Only ballots where a transferred candidate is current preference are affected
+    transferable = tuple(
+        ballot for ballot, _ in _iter_transferable_ballots(ballots, transfers, standing)
+    )
+    batches = _get_serial_batches(transferable, transfers, standing)
 
-        # Go through each transferable ballot where candidate is current preference
-        for ballot, _ in _iter_transferable_ballots(ballots, (candidate,), standing):
-            ballot.decrease_value(transfer_quota)
-            if target_candidate := ballot.get_next_preference(
-                standing + tuple(transfer_queue)
-            ):
-                transfer_log[(candidate, target_candidate)] += ballot.value
+    vote_count = dict(vote_count)
+    for candidate, batch in zip(transfers, batches):
+        if decrease_value:
+            transfer_quota = arithmetic.get_transfer_quota(vote_count[candidate], quota)
+            for ballot, _ in batch:
+                ballot.decrease_value(transfer_quota)
+        for ballot, target_candidate in batch:
+            if target_candidate is not None:
+                transfer_log[(candidate, target_candidate)] += ballot.weight
             else:
-                exhausted += ballot.value
+                exhausted += ballot.weight
 
         # Redo vote count for each vote transfer
-        vote_count = {
-            target: votes + transfer_log[(candidate, target)]
-            for target, votes in vote_count.items()
-        }
+        for (_from, target), weight in transfer_log.items():
+            if _from == candidate and target in vote_count:
+                vote_count[target] += arithmetic.to_decimal(weight)
+    _restack(ballots, transferable)
 
     # Return final transfer count, without transferred candidates.
     return (
-        transfer_log,
-        exhausted,
+        _to_decimal(arithmetic, transfer_log),
+        arithmetic.to_decimal(exhausted),
         {candidate: vote_count[candidate] for candidate in standing},
     )
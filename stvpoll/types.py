@@ -5,7 +5,7 @@ from decimal import Decimal
 from enum import Enum
 from typing import TypeVar, TypedDict
 
-from typing_extensions import Counter
+from typing_extensions import Counter, NamedTuple
 
 Candidate = TypeVar("Candidate", int, str)
 Candidates = tuple[Candidate, ...]
@@ -15,6 +15,15 @@ VoteTransfers = Counter[tuple[Candidate, Candidate]]
 Rounds = tuple[Votes, ...]
 
 
+class Duel(NamedTuple):
+    winner: Candidates
+    loser: Candidates
+    difference: Decimal
+
+
+Duels = tuple[Duel, ...]
+
+
 class CandidateStatus(str, Enum):
     Elected = "Elected"
     Excluded = "Excluded"
@@ -25,9 +34,17 @@ class SelectionMethod(str, Enum):
     TiebreakHistory = "Tiebreak (history)"
     TiebreakRandom = "Tiebreak (Random)"
     NoCompetition = "No competition left"
+    BulkExclusion = "Bulk exclusion"
     CPO = "Comparison of Pairs of Outcomes"
 
 
+class CPOTiebreak(str, Enum):
+    """Resolves CPO-STV polls without an outcome winning all duels"""
+
+    Minimax = "minimax"
+    RankedPairs = "ranked_pairs"
+
+
 class RoundDict(TypedDict):
     method: str
     selected: Candidates
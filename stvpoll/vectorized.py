@@ -0,0 +1,485 @@
+from __future__ import annotations
+
+from decimal import Decimal, getcontext
+from itertools import islice
+from typing import Iterable, Iterator
+
+from stvpoll.arithmetic import FixedPoint, FixedPointBallot
+from stvpoll.exceptions import STVException
+from stvpoll.store import BallotProfile
+from stvpoll.types import Candidate, Candidates, Duel, Votes, VoteTransfers
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no coverage
+    np = None
+
+
+def decrease_units(
+    units: np.ndarray,
+    votes: int | np.ndarray,
+    quota: int,
+    arithmetic: FixedPoint,
+) -> np.ndarray:
+    """
+    Multiply units by transfer quota (votes - quota) / votes, rounding half to even.
+    Votes are in units, for all units or one per unit.
+    Decimal rounds transfer quota and product to context precision first,
+    which may only change the result for products close to a half unit.
+    Those are computed exactly as Decimal would.
+    >>> decrease_units(np.array([100000, 50000]), np.array([300000, 700000]), 2, FixedPoint())
+    array([33333, 35714])
+    """
+    unit = arithmetic.unit
+    quotient, remainder = np.divmod(units * (votes - quota * unit), votes)
+    remainder += remainder
+    result = quotient + (
+        (remainder > votes) | ((remainder == votes) & (quotient & 1 == 1))
+    )
+    # At least 3 * votes * unit // 10 ** (context precision - 1), without overflow
+    scale = min(10 ** (getcontext().prec - 1) // (3 * unit), 2**62)
+    margin = votes // scale if scale else votes
+    if (close := np.abs(remainder - votes) <= margin).any():
+        votes = np.broadcast_to(votes, units.shape)[close]
+        transfer_quotas = {
+            v: arithmetic.get_transfer_quota(arithmetic.to_decimal(v), quota)
+            for v in map(int, np.unique(votes))
+        }
+        result[close] = [
+            transfer_quotas[int(v)].apply(int(u)) for u, v in zip(units[close], votes)
+        ]
+    return result
+
+
+class RankMatrix:
+    """
+    Ballot profile for vectorized counting, with NumPy.
+    Preferences are a padded matrix of candidate indexes, one row per ballot.
+    The index after the last candidate means exhausted, and pads all rows.
+    Ballot counts, multiplier units and cursor positions are vectors, so that
+    counting is a weighted bincount of current preferences, and transfers are
+    masked vector operations.
+    Ballot values are integer units of the FixedPoint arithmetic.
+    """
+
+    def __init__(
+        self,
+        ballots: Iterable[FixedPointBallot],
+        standing: Iterable[Candidate],
+        arithmetic: VectorizedFixedPoint,
+    ) -> None:
+        ballots = tuple(ballots)
+        self.arithmetic = arithmetic
+        standing = tuple(dict.fromkeys(standing))
+        self.candidates = list(standing)
+        self.index = {c: i for i, c in enumerate(self.candidates)}
+        for ballot in ballots:
+            for candidate in ballot:
+                if candidate not in self.index:
+                    self.index[candidate] = len(self.candidates)
+                    self.candidates.append(candidate)
+        self.exhausted = len(self.candidates)
+
+        lengths = np.fromiter(map(len, ballots), np.intp, len(ballots))
+        self.columns = np.arange(lengths.max(initial=0) + 1)
+        self.ranks = np.full((len(ballots), len(self.columns)), self.exhausted)
+        self.ranks[self.columns < lengths[:, None]] = np.fromiter(
+            (self.index[c] for ballot in ballots for c in ballot),
+            np.intp,
+            lengths.sum(),
+        )
+        self.counts = np.fromiter((b.count for b in ballots), np.int64, len(ballots))
+        self.units = np.full(len(ballots), arithmetic.unit, np.int64)
+        if int(self.counts.sum()) * arithmetic.unit**2 >= 2**63:
+            raise STVException("Too many ballots for vectorized counting")
+
+        self.standing = self.get_mask(standing)
+        self.rows = np.arange(len(ballots))
+        self.positions, self.current = self._scan(
+            self.rows, np.zeros(len(ballots), np.intp), self.standing
+        )
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.current != self.exhausted))
+
+    def __contains__(self, candidate: Candidate) -> bool:
+        index = self.index.get(candidate)
+        return index is not None and bool(self.standing[index])
+
+    def get_mask(self, candidates: Iterable[Candidate]) -> np.ndarray:
+        """Boolean mask of candidate indexes. Exhausted is always set, to stop scans."""
+        mask = np.zeros(self.exhausted + 1, bool)
+        mask[[self.index[c] for c in candidates]] = True
+        mask[self.exhausted] = True
+        return mask
+
+    def _scan(
+        self, rows: np.ndarray, positions: np.ndarray, mask: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """First position from cursor positions where mask is set, and candidate index there."""
+        ranks = self.ranks[rows]
+        hits = mask[ranks]
+        hits &= self.columns >= positions[:, None]
+        found = hits.argmax(axis=1)
+        return found, ranks[np.arange(len(rows)), found]
+
+    def _sum(self, indexes: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Sum weights per candidate index. Totals are small enough to be exact as float."""
+        return np.rint(
+            np.bincount(indexes, weights=weights, minlength=self.exhausted + 1)
+        ).astype(np.int64)
+
+    def _to_votes(self, sums: np.ndarray, candidates: Candidates) -> Votes:
+        to_decimal = self.arithmetic.to_decimal
+        return {
+            c: to_decimal(int(sums[self.index[c]])) for c in candidates if c in self
+        }
+
+    def _decrease(self, units: np.ndarray, votes: Decimal, quota: int) -> np.ndarray:
+        """Multiply units by transfer quota (votes - quota) / votes."""
+        return decrease_units(
+            units, int(votes.scaleb(self.arithmetic.precision)), quota, self.arithmetic
+        )
+
+    def _restack(
+        self, rows: np.ndarray, positions: np.ndarray, transfers: Candidates
+    ) -> None:
+        """Move cursors of transferred ballots to next standing candidate."""
+        self.standing[[self.index[c] for c in transfers]] = False
+        self.positions[rows], self.current[rows] = self._scan(
+            rows, positions, self.standing
+        )
+
+    def _get_transferable(self, transfers: Candidates) -> np.ndarray:
+        return self.rows[
+            np.isin(self.current, [self.index[c] for c in transfers if c in self])
+        ]
+
+    def merge(self) -> None:
+        """
+        Merge rows with the same remaining standing preferences and multiplier units.
+        Rows of exhausted ballots are dropped.
+        """
+        remaining = (
+            self.standing[self.ranks]
+            & (self.columns >= self.positions[:, None])
+            & (self.ranks != self.exhausted)
+        )
+        # Move remaining preferences first, keeping their order
+        order = np.argsort(~remaining, axis=1, kind="stable")
+        ranks = np.take_along_axis(
+            np.where(remaining, self.ranks, self.exhausted), order, axis=1
+        )[:, : remaining.sum(axis=1).max(initial=0) + 1]
+        active = ranks[:, 0] != self.exhausted
+        keys, inverse = np.unique(
+            np.column_stack((ranks[active], self.units[active])),
+            axis=0,
+            return_inverse=True,
+        )
+        self.counts = np.rint(
+            np.bincount(inverse.ravel(), weights=self.counts[active])
+        ).astype(np.int64)
+        self.ranks = keys[:, :-1]
+        self.units = keys[:, -1].copy()
+        self.columns = np.arange(self.ranks.shape[1])
+        self.rows = np.arange(len(keys))
+        self.positions = np.zeros(len(keys), np.intp)
+        self.current = self.ranks[:, 0].copy()
+
+    def get_votes(self, candidates: Candidates) -> Votes:
+        """
+        Count standing candidates, in candidate order.
+        >>> arithmetic = VectorizedFixedPoint()
+        >>> ballots = (arithmetic.ballot((1, 2), 2), arithmetic.ballot((2,), 1))
+        >>> RankMatrix(ballots, (2, 3), arithmetic).get_votes((1, 2, 3))
+        {2: Decimal('3'), 3: Decimal('0')}
+        """
+        return self._to_votes(
+            self._sum(self.current, self.units * self.counts), candidates
+        )
+
+    def recount(self, candidates: Candidates) -> Votes:
+        """Count all ballots again, scanning from first preference."""
+        _, current = self._scan(
+            self.rows, np.zeros(len(self.rows), np.intp), self.standing
+        )
+        return self._to_votes(self._sum(current, self.units * self.counts), candidates)
+
+    def transfer_all(
+        self,
+        vote_count: Votes,
+        transfers: Candidates,
+        standing: Candidates,
+        quota: int,
+        decrease_value: bool,
+    ) -> tuple[VoteTransfers, Decimal, Votes]:
+        """Vectorized version of stvpoll.transfer_strategies.transfer_all."""
+        to_decimal = self.arithmetic.to_decimal
+        rows = self._get_transferable(transfers)
+        positions, current = self.positions[rows], self.current[rows]
+        targets = self._scan(rows, positions, self.get_mask(standing))[1]
+        weights = self.units[rows] * self.counts[rows]
+        transfer_log = VoteTransfers()
+        exhausted = 0
+        for candidate in transfers:
+            selected = current == self.index[candidate]
+            if decrease_value:
+                units = self._decrease(
+                    self.units[rows[selected]], vote_count[candidate], quota
+                )
+                self.units[rows[selected]] = units
+                weights[selected] = units * self.counts[rows[selected]]
+            sums = self._sum(targets[selected], weights[selected])
+            for target in np.unique(targets[selected]):
+                if target == self.exhausted:
+                    exhausted += int(sums[target])
+                else:
+                    transfer_log[(candidate, self.candidates[target])] = to_decimal(
+                        int(sums[target])
+                    )
+        self._restack(rows, positions, transfers)
+        return (
+            transfer_log,
+            to_decimal(exhausted),
+            {
+                candidate: vote_count[candidate]
+                + sum(transfer_log[(_from, candidate)] for _from in transfers)
+                for candidate in standing
+            },
+        )
+
+    def transfer_serial(
+        self,
+        vote_count: Votes,
+        transfers: Candidates,
+        standing: Candidates,
+        quota: int,
+        decrease_value: bool,
+    ) -> tuple[VoteTransfers, Decimal, Votes]:
+        """Vectorized version of stvpoll.transfer_strategies.transfer_serial."""
+        to_decimal = self.arithmetic.to_decimal
+        rows = self._get_transferable(transfers)
+        positions = self.positions[rows]
+        units = self.units[rows]
+        counts = self.counts[rows]
+        transfer_log = VoteTransfers()
+        exhausted = 0
+
+        transfer_queue = list(transfers)
+        while transfer_queue:
+            candidate = transfer_queue.pop(0)
+            # Transferable ballots where candidate is first among standing
+            mask = self.get_mask((candidate,) + standing)
+            selected = self._scan(rows, positions, mask)[1] == self.index[candidate]
+            if decrease_value:
+                units[selected] = self._decrease(
+                    units[selected], vote_count[candidate], quota
+                )
+            targets = self._scan(
+                rows[selected],
+                positions[selected],
+                self.get_mask(standing + tuple(transfer_queue)),
+            )[1]
+            sums = self._sum(targets, units[selected] * counts[selected])
+            for target in np.unique(targets):
+                if target == self.exhausted:
+                    exhausted += int(sums[target])
+                else:
+                    transfer_log[(candidate, self.candidates[target])] = to_decimal(
+                        int(sums[target])
+                    )
+
+            # Redo vote count for each vote transfer
+            vote_count = {
+                target: votes + transfer_log[(candidate, target)]
+                for target, votes in vote_count.items()
+            }
+        self.units[rows] = units
+        self._restack(rows, positions, transfers)
+
+        # Return final transfer count, without transferred candidates.
+        return (
+            transfer_log,
+            to_decimal(exhausted),
+            {candidate: vote_count[candidate] for candidate in standing},
+        )
+
+
+class VectorizedFixedPoint(FixedPoint):
+    """
+    FixedPoint arithmetic counting ballots in a RankMatrix, using NumPy.
+    Works with transfer_serial and transfer_all transfer strategies.
+    Results are identical to DecimalArithmetic rounding to the same number of decimals.
+    """
+
+    def __init__(self, precision: int = 5) -> None:
+        if np is None:  # pragma: no coverage
+            raise ImportError("VectorizedFixedPoint requires numpy")
+        super().__init__(precision)
+
+    def piles(
+        self, ballots: Iterable[FixedPointBallot], standing: Iterable[Candidate]
+    ) -> RankMatrix:
+        return RankMatrix(ballots, standing, self)
+
+
+class DuelMatrix:
+    """
+    CPO duels of a batch of outcome pairs at once, with NumPy.
+    Distinct rankings of a ballot profile are rows of a padded rank matrix, as in
+    RankMatrix. Each pair in a batch has a row of boolean masks, for candidates in
+    either outcome and standing candidates, and a row of votes per candidate and
+    multiplier units per ranking. Counts and surplus transfers are array operations
+    over the whole batch, one step for each candidate in both outcomes.
+    Votes are integer units of FixedPoint arithmetic, so duels are identical to those of
+    outcomes_duel with the default rounding to 5 decimals.
+    >>> profile = BallotProfile(('A', 'B', 'C'))
+    >>> profile.add(('A', 'B'), 3)
+    >>> profile.add(('C',), 2)
+    >>> list(DuelMatrix(profile).duels([(('A', 'B'), ('A', 'C'))], 2))
+    [Duel(winner=('A', 'C'), loser=('A', 'B'), difference=Decimal('1.00001'))]
+    """
+
+    def __init__(
+        self,
+        profile: BallotProfile,
+        candidates: Iterable[Candidate] | None = None,
+        precision: int = 5,
+        batch_size: int = 1 << 22,
+    ) -> None:
+        if np is None:  # pragma: no coverage
+            raise ImportError("DuelMatrix requires numpy")
+        self.candidates = (
+            profile.candidates if candidates is None else tuple(candidates)
+        )
+        self.index = {c: i for i, c in enumerate(self.candidates)}
+        self.arithmetic = FixedPoint(precision)
+        self.exhausted = len(self.candidates)
+        preferences, offsets, counts = (
+            profile.preferences,
+            profile.offsets,
+            profile.counts,
+        )
+        merged: dict[tuple[int, ...], int] = {}
+        for row in range(len(profile)):
+            ranking = tuple(preferences[offsets[row] : offsets[row + 1]])
+            merged[ranking] = merged.get(ranking, 0) + counts[row]
+        lengths = np.fromiter(map(len, merged), np.intp, len(merged))
+        columns = np.arange(lengths.max(initial=0) + 1)
+        self.ranks = np.full((len(merged), len(columns)), self.exhausted)
+        self.ranks[columns < lengths[:, None]] = np.fromiter(
+            (c for ranking in merged for c in ranking), np.intp, lengths.sum()
+        )
+        self.counts = np.fromiter(merged.values(), np.int64, len(merged))
+        if int(self.counts.sum()) * self.arithmetic.unit**2 >= 2**63:
+            raise STVException("Too many ballots for vectorized duels")
+        # Pairs per batch, for at most batch_size items in masks of all preferences
+        self.batch_size = max(1, batch_size // max(1, self.ranks.size))
+
+    def _first(self, standing: np.ndarray) -> np.ndarray:
+        """First standing preference of each ranking, for each row of standing masks."""
+        found = standing[:, self.ranks].argmax(axis=2)
+        return self.ranks[np.arange(len(self.ranks)), found]
+
+    def _scan(
+        self, standing: np.ndarray, pairs: np.ndarray, rows: np.ndarray
+    ) -> np.ndarray:
+        """First preference of rankings in rows, standing in masks of pairs."""
+        ranks = self.ranks[rows]
+        return ranks[
+            np.arange(len(rows)), standing[pairs[:, None], ranks].argmax(axis=1)
+        ]
+
+    def _sum(
+        self, pairs: np.ndarray, indexes: np.ndarray, weights: np.ndarray, size: int
+    ) -> np.ndarray:
+        """Sum weights per pair and candidate index. Totals are exact as float."""
+        width = self.exhausted + 1
+        return (
+            np.rint(
+                np.bincount(
+                    (pairs * width + indexes).ravel(),
+                    weights=weights.ravel(),
+                    minlength=size * width,
+                )
+            )
+            .astype(np.int64)
+            .reshape(size, width)
+        )
+
+    def _count(
+        self, compared: list[tuple[Candidates, Candidates]], quota: int
+    ) -> list[Duel]:
+        size = len(compared)
+        width = self.exhausted + 1
+        index = self.index
+        members = np.zeros((2, size, width), bool)
+        surplus = []
+        for pair, (outcome1, outcome2) in enumerate(compared):
+            members[0, pair, [index[c] for c in outcome1]] = True
+            members[1, pair, [index[c] for c in outcome2]] = True
+            # Same order as outcomes_duel
+            surplus.append([index[c] for c in set(outcome1) & set(outcome2)])
+        steps = np.full((size, max(map(len, surplus))), self.exhausted)
+        for pair, order in enumerate(surplus):
+            steps[pair, : len(order)] = order
+
+        # Candidates in neither outcome are eliminated
+        standing = members[0] | members[1]
+        standing[:, self.exhausted] = True
+        pairs = np.arange(size)[:, None]
+        current = self._first(standing)
+        votes = self._sum(
+            pairs,
+            current,
+            np.broadcast_to(self.counts * self.arithmetic.unit, current.shape),
+            size,
+        )
+        units = np.full(current.shape, self.arithmetic.unit, np.int64)
+        limit = quota * self.arithmetic.unit
+
+        for step in steps.T:
+            active = np.flatnonzero(step != self.exhausted)
+            candidate = step[active]
+            over = votes[active, candidate] > limit
+            capped = active[over]
+            # Rankings at candidate move on to their next standing preference
+            standing[active, candidate] = False
+            moved, rows = np.nonzero(current[active] == candidate[:, None])
+            over, moved = over[moved], active[moved]
+            current[moved, rows] = self._scan(standing, moved, rows)
+            if over.any():
+                # Surplus of candidates over quota moves with them
+                transferred, rows = moved[over], rows[over]
+                decreased = decrease_units(
+                    units[transferred, rows],
+                    votes[transferred, step[transferred]],
+                    quota,
+                    self.arithmetic,
+                )
+                units[transferred, rows] = decreased
+                votes += self._sum(
+                    transferred,
+                    current[transferred, rows],
+                    decreased * self.counts[rows],
+                    size,
+                )
+            votes[capped, step[capped]] = limit
+
+        totals = (votes * members).sum(axis=2)
+        to_decimal = self.arithmetic.to_decimal
+        return [
+            # Loser is the first outcome if tied, as with outcomes_duel
+            Duel(outcome2, outcome1, to_decimal(int(total2 - total1)))
+            if total1 <= total2
+            else Duel(outcome1, outcome2, to_decimal(int(total1 - total2)))
+            for (outcome1, outcome2), total1, total2 in zip(compared, *totals)
+        ]
+
+    def duels(
+        self, compared: Iterable[tuple[Candidates, Candidates]], quota: int
+    ) -> Iterator[Duel]:
+        """Duels of outcome pairs, in order, counted in batches."""
+        compared = iter(compared)
+        while batch := list(islice(compared, self.batch_size)):
+            yield from self._count(batch, quota)
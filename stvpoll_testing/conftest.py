@@ -0,0 +1,113 @@
+import random
+from functools import partial
+from random import Random
+from typing import Any, Callable
+
+import pytest
+
+from stvpoll.result import ElectionResult
+
+Options = dict[str, Any]
+
+
+def random_ballots(rnd: Random, candidates: tuple[str, ...], count: int = 60):
+    """Ballots ranking one to all candidates, with counts from 1 to 9."""
+    return [
+        (rnd.sample(candidates, rnd.randint(1, len(candidates))), rnd.randint(1, 9))
+        for _ in range(count)
+    ]
+
+
+def count_methods(
+    candidates: tuple[str, ...], ballots, seats: int
+) -> tuple[Callable[..., ElectionResult], ...]:
+    """Scottish STV, IRV and STV transferring all ballots, verifying the tally."""
+    from stvpoll.base import calculate_stv
+    from stvpoll.irv import calculate_irv
+    from stvpoll.quotas import droop_quota
+    from stvpoll.scottish_stv import calculate_scottish_stv
+    from stvpoll.tiebreak_strategies import TiebreakHistory
+    from stvpoll.transfer_strategies import transfer_all
+
+    return (
+        partial(
+            calculate_scottish_stv, candidates, ballots, seats, random_shuffle=False
+        ),
+        partial(calculate_irv, candidates, ballots, random_shuffle=False),
+        partial(
+            calculate_stv,
+            candidates,
+            ballots,
+            seats,
+            tiebreak_strategies=(TiebreakHistory(),),
+            transfer_strategy=transfer_all,
+            quota_method=droop_quota,
+            verify_tally=True,
+        ),
+    )
+
+
+def count_poll(
+    candidates: tuple[str, ...], ballots, seats: int, options: Options
+) -> ElectionResult:
+    """Count with the ScottishSTV poll class, seeding its candidate shuffle by seats."""
+    from stvpoll.scottish_stv import ScottishSTV
+
+    random.seed(seats)
+    poll = ScottishSTV(seats, candidates, **options)
+    for ballot in ballots:
+        poll.add_ballot(*ballot)
+    return poll.calculate()
+
+
+def assert_same_result(result: ElectionResult, expected: ElectionResult) -> None:
+    assert result == expected
+    assert result.exhausted == expected.exhausted
+    assert result.empty_ballot_count == expected.empty_ballot_count
+    assert [r.votes for r in result.rounds] == [r.votes for r in expected.rounds]
+    assert result.transfer_log == expected.transfer_log
+
+
+def _compare_polls(
+    seed: int,
+    options: list[tuple[Options, Options]],
+    *,
+    candidates: tuple[str, ...] = tuple("abcdefgh"),
+    ballots: Callable[[Random, tuple[str, ...]], list] | None = None,
+    ballot_count: int = 60,
+    extra_ballots: tuple = (),
+    seats: int = 5,
+    polls: int = 20,
+) -> list[tuple[ElectionResult, ElectionResult]]:
+    rnd = Random(seed)
+    compared = []
+    for _ in range(polls):
+        if ballots is None:
+            poll_ballots = random_ballots(rnd, candidates, ballot_count)
+        else:
+            poll_ballots = ballots(rnd, candidates)
+        poll_ballots += extra_ballots
+        poll_seats = rnd.randint(1, seats)
+        for reference, other in options:
+            for count in count_methods(candidates, poll_ballots, poll_seats):
+                compared.append((count(**other), count(**reference)))
+            compared.append(
+                (
+                    count_poll(candidates, poll_ballots, poll_seats, other),
+                    count_poll(candidates, poll_ballots, poll_seats, reference),
+                )
+            )
+    for result, expected in compared:
+        assert_same_result(result, expected)
+    return compared
+
+
+@pytest.fixture
+def compare_polls():
+    """
+    Count random polls from seed with each pair of reference and other options,
+    by count_methods and the ScottishSTV class, and check that results are the same.
+    Polls have random_ballots, or ballots from rnd and candidates, and extra_ballots.
+    Returns pairs of result and expected result, for checks of their own.
+    """
+    return _compare_polls
@@ -0,0 +1,115 @@
+from decimal import Decimal, localcontext
+from random import Random
+
+import pytest
+
+from stvpoll.exceptions import STVException
+
+
+def mk_multipliers(rnd: Random, precision: int):
+    """Random multipliers, and some that are one unit from a half unit after transfer"""
+    unit = 10**precision
+    for _ in range(300):
+        yield rnd.randint(0, unit)
+    yield from (1, 3, 5, unit - 1, unit)
+
+
+@pytest.mark.parametrize("context_precision", (28, 12, 8))
+def test_fixed_point_identical_to_decimal(context_precision: int):
+    from stvpoll.arithmetic import DecimalArithmetic, FixedPoint
+    from stvpoll.ballots import rounding_method
+
+    rnd = Random(context_precision)
+    fixed, decimal = FixedPoint(), DecimalArithmetic(rounding_method)
+    with localcontext() as context:
+        context.prec = context_precision
+        for _ in range(40):
+            quota = rnd.randint(1, 5000)
+            votes = (
+                Decimal(quota + rnd.choice((quota, rnd.randint(0, 10**6)))).scaleb(
+                    -rnd.randint(0, 5)
+                )
+                + quota
+            )
+            fixed_quota = fixed.get_transfer_quota(votes, quota)
+            decimal_quota = decimal.get_transfer_quota(votes, quota)
+            for units in mk_multipliers(rnd, 5):
+                fixed_ballot = fixed.ballot((1,), 3)
+                fixed_ballot.units = units
+                decimal_ballot = decimal.ballot((1,), 3)
+                decimal_ballot.multiplier = fixed_ballot.multiplier
+                fixed_ballot.decrease_value(fixed_quota)
+                decimal_ballot.decrease_value(decimal_quota)
+                assert str(fixed_ballot.multiplier) == str(decimal_ballot.multiplier)
+                assert str(fixed_ballot.value) == str(decimal_ballot.value)
+                assert fixed.to_decimal(fixed_ballot.weight) == decimal_ballot.weight
+
+
+def test_fixed_point_precision():
+    from stvpoll.arithmetic import FixedPoint, FixedPointQuota
+
+    arithmetic = FixedPoint(precision=2)
+    ballot = arithmetic.ballot((1, 2), 2)
+    assert ballot.units == 100
+    ballot.decrease_value(arithmetic.get_transfer_quota(Decimal(3), 2))
+    assert ballot.multiplier == Decimal("0.33")
+    assert ballot.value == Decimal("0.66")
+    ballot.decrease_value(FixedPointQuota(Decimal(1), 2))
+    assert ballot.units == 33
+    with pytest.raises(STVException):
+        arithmetic.get_transfer_quota(Decimal(1), 2)
+
+
+def test_fixed_point_half_units():
+    from stvpoll.arithmetic import DecimalArithmetic, FixedPoint
+
+    # Transfer quota of one half: odd units end on a half unit, rounded to even
+    fixed, decimal = FixedPoint(), DecimalArithmetic()
+    fixed_quota = fixed.get_transfer_quota(Decimal(4), 2)
+    decimal_quota = decimal.get_transfer_quota(Decimal(4), 2)
+    for units, expected in ((1, 0), (3, 2), (5, 2), (7, 4), (99999, 50000)):
+        ballot = fixed.ballot((1,), 1)
+        ballot.units = units
+        ballot.decrease_value(fixed_quota)
+        assert ballot.units == expected
+        decimal_ballot = decimal.ballot((1,), 1)
+        decimal_ballot.multiplier = Decimal(units).scaleb(-5)
+        decimal_ballot.decrease_value(decimal_quota)
+        assert decimal_ballot.multiplier == ballot.multiplier
+
+
+def test_fixed_point_decimals():
+    from stvpoll.arithmetic import FixedPoint
+    from stvpoll.scottish_stv import calculate_scottish_stv
+
+    arithmetic = FixedPoint()
+    assert str(arithmetic.to_decimal(6000000)) == "60"
+    assert str(arithmetic.to_decimal(0)) == "0"
+    assert str(arithmetic.to_decimal(92308)) == "0.92308"
+
+    # Votes, transfers and exhausted votes read the same as with Decimal arithmetic
+    candidates = ("Andrea", "Batman", "Robin", "Gorm")
+    ballots = (
+        (("Andrea", "Batman"), 9),
+        (("Andrea", "Robin"), 4),
+        (("Batman",), 5),
+        (("Robin", "Gorm"), 6),
+        (("Gorm",), 3),
+    )
+    decimal_result = calculate_scottish_stv(
+        candidates, ballots, 2, random_shuffle=False
+    )
+    fixed_result = calculate_scottish_stv(
+        candidates, ballots, 2, random_shuffle=False, arithmetic=arithmetic
+    )
+    assert [str(r.votes) for r in fixed_result.rounds] == [
+        str(r.votes) for r in decimal_result.rounds
+    ]
+    assert str(fixed_result.transfer_log) == str(decimal_result.transfer_log)
+    assert str(fixed_result.exhausted) == str(decimal_result.exhausted) == "9.92308"
+
+
+def test_fixed_point_polls(compare_polls):
+    from stvpoll.arithmetic import FixedPoint
+
+    compare_polls(7, [({}, {"arithmetic": FixedPoint()})])
@@ -1,4 +1,5 @@
 from collections import Counter
+from decimal import Decimal
 
 import pytest
 
@@ -112,3 +113,111 @@ def test_counter_votes():
     assert result.complete
     assert result.empty_ballot_count == 1
     assert result == ["a", "b"]
+
+
+def test_verify_tally():
+    from stvpoll.base import calculate_stv
+    from stvpoll.transfer_strategies import transfer_serial
+    from stvpoll.quotas import droop_quota
+
+    ballots = (
+        (("a", "b", "c"), 4),
+        (("b", "c"), 2),
+        (("c", "d"), 2),
+        (("d", "b"), 1),
+    )
+    kwargs = dict(
+        candidates=("a", "b", "c", "d"),
+        ballots=ballots,
+        tiebreak_strategies=(),
+        transfer_strategy=transfer_serial,
+        winners=2,
+        quota_method=droop_quota,
+    )
+    result = calculate_stv(verify_tally=True, **kwargs)
+    assert result.complete
+    assert [r.votes for r in result.rounds] == [
+        r.votes for r in calculate_stv(**kwargs).rounds
+    ]
+
+
+def test_verify_tally_mismatch():
+    from stvpoll.base import calculate_stv
+    from stvpoll.transfer_strategies import transfer_serial
+    from stvpoll.quotas import droop_quota
+
+    def leaky_transfer(**kwargs):
+        transfers, exhausted, votes = transfer_serial(**kwargs)
+        return transfers, exhausted, {c: v + 1 for c, v in votes.items()}
+
+    with pytest.raises(STVException):
+        calculate_stv(
+            candidates=("a", "b", "c"),
+            ballots=((("a", "b"), 3), (("b",), 1), (("c",), 2)),
+            tiebreak_strategies=(),
+            transfer_strategy=leaky_transfer,
+            winners=2,
+            quota_method=droop_quota,
+            verify_tally=True,
+        )
+
+
+def test_interned_candidates():
+    from stvpoll.base import calculate_stv
+    from stvpoll.tiebreak_strategies import TiebreakRandom
+    from stvpoll.transfer_strategies import transfer_serial
+    from stvpoll.quotas import droop_quota
+
+    # Candidate 0 must not be mistaken for an exhausted ballot
+    result = calculate_stv(
+        candidates=(2, 1, 0),
+        ballots=(((1, 0), 6), ((0,), 2), ((2,), 3)),
+        tiebreak_strategies=(TiebreakRandom((2, 1, 0), shuffle=False),),
+        transfer_strategy=transfer_serial,
+        winners=2,
+        quota_method=droop_quota,
+    )
+    assert result == [1, 0]
+    assert result.transfer_log[0] == {(1, 0): Decimal("1.99998")}
+    assert result.rounds[0].votes == {2: 3, 1: 6, 0: 2}
+    assert result.exhausted == 3
+
+    with pytest.raises(STVException):
+        calculate_stv(
+            candidates=("a", "b"),
+            ballots=[(["a", "d"], 1)],
+            tiebreak_strategies=(),
+            transfer_strategy=transfer_serial,
+            winners=1,
+            quota_method=droop_quota,
+        )
+
+
+def test_bulk_exclusion_keeps_seats():
+    from stvpoll.base import get_bulk_exclusion
+
+    votes = {"a": Decimal(20), "b": Decimal(3), "c": Decimal(0), "d": Decimal(0)}
+    assert get_bulk_exclusion(votes, 30, 1) == ("c", "d", "b")
+    assert get_bulk_exclusion(votes, 30, 2) == ("c", "d")
+    assert get_bulk_exclusion(votes, 30, 3) == ()
+    # Transfers could bring a candidate to quota
+    assert get_bulk_exclusion(votes, 23, 1) == ("c", "d")
+
+
+def test_standing_candidates():
+    from stvpoll.scottish_stv import ScottishSTV
+    from stvpoll.types import SelectionMethod
+
+    poll = ScottishSTV(seats=1, candidates=("a", "b", "c", "d"))
+    poll.candidates = ("a", "b", "c", "d")
+    poll.add_ballot(["a", "b"], 3)
+    poll.add_ballot(["c"], 2)
+    poll.initial_votes()
+    assert poll.standing_candidates == ("a", "b", "c", "d")
+    poll.exclude("b", SelectionMethod.Direct)
+    assert poll.standing_candidates == ("a", "c", "d")
+    assert poll.standing == {"a", "c", "d"}
+    poll.elect(("d", "a"), SelectionMethod.Direct)
+    assert poll.standing_candidates == ("c",)
+    assert not poll.result.still_standing("a")
+    assert poll.result.still_standing("c")
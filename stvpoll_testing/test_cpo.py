@@ -59,7 +59,19 @@ def test_cpo_extreme_tie():
     assert result.randomized
     assert result.complete
     assert result.empty_ballot_count == 0
+    # Fjodor has quota, so only outcomes with Fjodor tie. The seeded draw among them
+    # elects Batman, where a draw among all outcomes elected Andrea.
+    assert result.elected_as_tuple() == ("Fjodor", "Batman")
+    assert result.result_extra["outcome_pruning"]["required"] == ("Fjodor",)
+    # Without pruning, the draw is among all outcomes as before
+    seed(42)
+    poll = CPO_STV(seats=2, candidates=example_candidates, prune_required=False)
+    for b in example_ballots:
+        poll.add_ballot(*b)
+    result = poll.calculate()
+    assert result.randomized
     assert result.elected_as_tuple() == ("Fjodor", "Andrea")
+    assert "outcome_pruning" not in result.result_extra
     # Function based
     result = calculate_cpo_stv(example_candidates, example_ballots, 2)
     assert result.randomized
@@ -131,3 +143,592 @@ def test_all_elected():
     )
     assert not result.randomized
     assert result.complete
+
+
+def test_shared_duel_ballots():
+    from stvpoll.cpo_stv import CPO_STV, calculate_cpo_stv
+    from stvpoll.store import BallotProfile
+
+    example_candidates = ("Andrea", "Carter", "Brad", "Delilah", "Scott")
+    example_ballots = (
+        (("Andrea",), 25),
+        (("Carter", "Brad", "Delilah"), 34),
+        (("Brad", "Delilah"), 7),
+        (("Delilah", "Brad"), 8),
+        (("Delilah", "Scott"), 5),
+        (("Scott", "Delilah"), 21),
+        ((), 2),
+    )
+    profile = BallotProfile(example_candidates)
+    for b in example_ballots:
+        profile.add(*b)
+    arrays = (profile.preferences.tobytes(), profile.counts.tobytes())
+    result = calculate_cpo_stv(example_candidates, profile, 3)
+    assert result.elected_as_set() == {"Carter", "Andrea", "Delilah"}
+    assert result.empty_ballot_count == 2
+    assert (profile.preferences.tobytes(), profile.counts.tobytes()) == arrays
+    # Duels leave ballots of the poll as they were
+    for compact_ballots in (False, True):
+        poll = CPO_STV(
+            seats=3, candidates=example_candidates, compact_ballots=compact_ballots
+        )
+        for b in example_ballots:
+            poll.add_ballot(*b)
+        assert poll.calculate().elected_as_set() == {"Carter", "Andrea", "Delilah"}
+        assert all(b.multiplier == 1 for b in poll.ballots)
+
+
+def test_duel_projections():
+    from random import Random
+
+    from stvpoll.cpo_stv import DuelBallots
+    from stvpoll.store import BallotProfile
+
+    rnd = Random(3)
+    candidates = tuple("abcdefg")
+    profile = BallotProfile(candidates)
+    for _ in range(500):
+        profile.add(rnd.sample(candidates, rnd.randint(1, 7)), rnd.randint(1, 3))
+    ballots = DuelBallots(profile)
+
+    def rankings(duel_ballots):
+        return {
+            tuple(duel_ballots.preferences[start:end]): count
+            for start, end, count in zip(
+                duel_ballots.offsets, duel_ballots.offsets[1:], duel_ballots.counts
+            )
+        }
+
+    subset = frozenset((0, 2, 4))
+    # Projected directly, and from a projection with more candidates
+    direct = rankings(ballots.project(subset))
+    ballots = DuelBallots(profile)
+    ballots.project(frozenset((0, 1, 2, 4)))
+    assert rankings(ballots.project(subset)) == direct
+    assert ballots.project(subset) is ballots.project(subset)
+    assert sum(direct.values()) == sum(
+        count
+        for start, end, count in zip(
+            profile.offsets, profile.offsets[1:], profile.counts
+        )
+        if subset.intersection(profile.preferences[start:end])
+    )
+    assert all(subset.issuperset(ranking) for ranking in direct)
+
+
+def test_condorcet_search():
+    from random import Random
+
+    from stvpoll.cpo_stv import CPO_STV, calculate_cpo_stv
+
+    rnd = Random(8)
+    candidates = tuple("abcdef")
+    found = 0
+    for _ in range(30):
+        ballots = [
+            (rnd.sample(candidates, rnd.randint(1, 6)), rnd.randint(1, 4))
+            for _ in range(rnd.randint(5, 40))
+        ]
+        seats = rnd.randint(1, 4)
+        seed(seats)
+        expected = calculate_cpo_stv(candidates, ballots, seats, condorcet_search=False)
+        seed(seats)
+        result = calculate_cpo_stv(candidates, ballots, seats)
+        assert result == expected
+        assert result.randomized == expected.randomized
+        found += not result.randomized
+        results = []
+        for condorcet_search in (False, True):
+            seed(seats)
+            poll = CPO_STV(
+                seats=seats, candidates=candidates, condorcet_search=condorcet_search
+            )
+            for ballot in ballots:
+                poll.add_ballot(*ballot)
+            results.append(poll.calculate())
+        assert results[0] == results[1]
+    assert found
+
+
+def test_outcome_pruning():
+    from random import Random
+
+    from stvpoll.cpo_stv import (
+        CPO_STV,
+        DuelBallots,
+        calculate_cpo_stv,
+        get_duels_result,
+        get_outcomes,
+    )
+    from stvpoll.store import BallotProfile
+
+    example_candidates = ("Andrea", "Carter", "Brad", "Delilah", "Scott")
+    example_ballots = (
+        (("Andrea",), 25),
+        (("Carter", "Brad", "Delilah"), 34),
+        (("Brad", "Delilah"), 7),
+        (("Delilah", "Brad"), 8),
+        (("Delilah", "Scott"), 5),
+        (("Scott", "Delilah"), 21),
+    )
+    result = calculate_cpo_stv(example_candidates, example_ballots, 3)
+    assert result.elected_as_set() == {"Carter", "Andrea", "Delilah"}
+    # Quota is 26, only Carter has it
+    assert result.as_dict()["outcome_pruning"] == {
+        "required": ("Carter",),
+        "excluded": (),
+        "outcomes": 10,
+        "remaining": 6,
+    }
+    poll = CPO_STV(seats=3, candidates=example_candidates, prune_hopeless=True)
+    for b in example_ballots:
+        poll.add_ballot(*b)
+    result = poll.calculate()
+    assert result.elected_as_set() == {"Carter", "Andrea", "Delilah"}
+    assert result.result_extra["outcome_pruning"]["required"] == ("Carter",)
+
+    # Pruning can change the winner. C2 has a quota of first preferences, but no outcome
+    # wins all duels, and minimax over all ten outcomes elects C3 and C4.
+    candidates = ("C0", "C1", "C2", "C3", "C4")
+    ballots = [
+        (("C4", "C0", "C3", "C2"), 9),
+        (("C2", "C0", "C3", "C1"), 9),
+        (("C3", "C1", "C4"), 9),
+        (("C2", "C0", "C4", "C3", "C1"), 6),
+        (("C1", "C4", "C2", "C0", "C3"), 8),
+        (("C3", "C2"), 3),
+    ]
+    result = calculate_cpo_stv(candidates, ballots, 2)
+    assert result.elected_as_set() == {"C2", "C3"}
+    assert result.result_extra["outcome_pruning"]["required"] == ("C2",)
+    profile = BallotProfile(candidates)
+    for ballot in ballots:
+        profile.add(*ballot)
+    outcomes = tuple(get_outcomes(candidates, 2))
+    winner = get_duels_result(DuelBallots(profile), outcomes, 15, False, result)
+    assert winner == ("C3", "C4")
+
+    # Pruning hopeless candidates never changes a result without random tiebreaks
+    rnd = Random(12)
+    candidates = tuple("abcdef")
+    for _ in range(30):
+        ballots = [
+            (rnd.sample(candidates, rnd.randint(1, 6)), rnd.randint(1, 12))
+            for _ in range(rnd.randint(5, 30))
+        ]
+        seats = rnd.randint(1, 4)
+        expected = calculate_cpo_stv(candidates, ballots, seats, condorcet_search=False)
+        result = calculate_cpo_stv(candidates, ballots, seats, prune_hopeless=True)
+        if not expected.randomized:
+            assert result == expected
+            assert not result.randomized
+
+
+def test_parallel_duels():
+    from random import Random
+
+    from stvpoll.arithmetic import DecimalArithmetic, FixedPoint
+    from stvpoll.cpo_stv import (
+        CPO_STV,
+        DuelBallots,
+        calculate_cpo_stv,
+        get_outcomes,
+        iter_pairwise_duels,
+    )
+    from stvpoll.store import BallotProfile
+
+    rnd = Random(21)
+    candidates = tuple("abcdef")
+    ballots = [
+        (rnd.sample(candidates, rnd.randint(1, 6)), rnd.randint(1, 4))
+        for _ in range(60)
+    ]
+    profile = BallotProfile(candidates)
+    for ballot in ballots:
+        profile.add(*ballot)
+    outcomes = tuple(get_outcomes(candidates, 3))
+    duels = tuple(iter_pairwise_duels(DuelBallots(profile), outcomes, 20))
+    assert len(duels) == 190
+    assert (
+        tuple(iter_pairwise_duels(DuelBallots(profile), outcomes, 20, processes=2))
+        == duels
+    )
+    # Workers rebuild ballots rounding to the same precision
+    rounded = tuple(
+        iter_pairwise_duels(DuelBallots(profile, precision=2), outcomes, 20)
+    )
+    assert rounded != duels
+    assert (
+        tuple(
+            iter_pairwise_duels(
+                DuelBallots(profile, precision=2), outcomes, 20, processes=2
+            )
+        )
+        == rounded
+    )
+
+    seed(1)
+    expected = calculate_cpo_stv(candidates, ballots, 3, condorcet_search=False)
+    seed(1)
+    result = calculate_cpo_stv(
+        candidates, ballots, 3, condorcet_search=False, processes=2
+    )
+    assert result == expected
+    # Cache stats add up those of workers, which look up transfers of every duel
+    stats = result.result_extra["duel_cache"]
+    expected_stats = expected.result_extra["duel_cache"]["transfers"]
+    assert stats["transfers"]["hits"] + stats["transfers"]["misses"] == (
+        expected_stats["hits"] + expected_stats["misses"]
+    )
+    assert all(s["entries"] > 0 and s["bytes"] > 0 for s in stats.values())
+    seed(1)
+    poll = CPO_STV(seats=3, candidates=candidates, condorcet_search=False, processes=2)
+    for ballot in ballots:
+        poll.add_ballot(*ballot)
+    assert poll.calculate().elected_as_set() == expected.elected_as_set()
+    # Poll arithmetic, here with a local rounding method, never goes to workers
+    for arithmetic in (FixedPoint(3), DecimalArithmetic(lambda value: round(value, 3))):
+        results = []
+        for processes in (0, 2):
+            seed(1)
+            poll = CPO_STV(
+                seats=3,
+                candidates=candidates,
+                condorcet_search=False,
+                processes=processes,
+                arithmetic=arithmetic,
+            )
+            for ballot in ballots:
+                poll.add_ballot(*ballot)
+            results.append(poll.calculate())
+        assert results[0] == results[1]
+
+
+def test_duel_cache():
+    from random import Random
+
+    from stvpoll.cpo_stv import CPO_STV, calculate_cpo_stv
+
+    rnd = Random(5)
+    candidates = tuple("abcdefg")
+    ballots = [
+        (rnd.sample(candidates, rnd.randint(1, 7)), rnd.randint(1, 4))
+        for _ in range(80)
+    ]
+    results = [
+        calculate_cpo_stv(
+            candidates,
+            ballots,
+            3,
+            allow_random=False,
+            condorcet_search=False,
+            duel_cache_size=size,
+        )
+        for size in (0, 10, 10000)
+    ]
+    assert results[0] == results[1] == results[2]
+    uncached, small, large = (r.result_extra["duel_cache"] for r in results)
+    assert uncached["transfers"]["hits"] == 0
+    assert uncached["transfers"]["entries"] == uncached["transfers"]["bytes"] == 0
+    assert small["transfers"]["entries"] == small["projections"]["entries"] == 10
+    assert large["transfers"]["hits"] > small["transfers"]["hits"] > 0
+    assert large["transfers"]["hits"] + large["transfers"]["misses"] == 595
+    assert large["transfers"]["bytes"] > small["transfers"]["bytes"]
+
+    poll = CPO_STV(seats=3, candidates=candidates, duel_cache_size=10)
+    for ballot in ballots:
+        poll.add_ballot(*ballot)
+    result = poll.calculate()
+    assert result.as_dict()["duel_cache"]["transfers"]["max_entries"] == 10
+
+
+def test_ranked_pairs():
+    from random import Random
+
+    from stvpoll.cpo_stv import (
+        CPO_STV,
+        DuelBallots,
+        DuelResults,
+        calculate_cpo_stv,
+        get_outcomes,
+        iter_pairwise_duels,
+    )
+    from stvpoll.quotas import droop_quota
+    from stvpoll.store import BallotProfile
+    from stvpoll.types import CPOTiebreak
+
+    def lock_pairs(outcomes, duels):
+        # Plain Ranked Pairs, searching locked duels for a cycle before each lock
+        locked = {outcome: set() for outcome in outcomes}
+
+        def reaches(start, target):
+            seen, stack = set(), [start]
+            while stack:
+                outcome = stack.pop()
+                if outcome == target:
+                    return True
+                if outcome not in seen:
+                    seen.add(outcome)
+                    stack.extend(locked[outcome])
+            return False
+
+        for duel in sorted(
+            (d for d in duels if d.difference),
+            key=lambda d: d.difference,
+            reverse=True,
+        ):
+            if not reaches(duel.loser, duel.winner):
+                locked[duel.winner].add(duel.loser)
+        beaten = set().union(*locked.values())
+        return [outcome for outcome in outcomes if outcome not in beaten]
+
+    rnd = Random(23)
+    candidates = tuple("abcdef")
+    cycles = 0
+    for _ in range(40):
+        ballots = [
+            (rnd.sample(candidates, rnd.randint(1, 6)), rnd.randint(1, 3))
+            for _ in range(rnd.randint(5, 30))
+        ]
+        seats = rnd.randint(2, 4)
+        profile = BallotProfile(candidates)
+        for ballot in ballots:
+            profile.add(*ballot)
+        outcomes = tuple(get_outcomes(candidates, seats))
+        duels = tuple(
+            iter_pairwise_duels(
+                DuelBallots(profile), outcomes, droop_quota(sum(profile.counts), seats)
+            )
+        )
+        duel_results = DuelResults(outcomes)
+        for duel in duels:
+            duel_results.add(duel)
+        winners = lock_pairs(outcomes, duels)
+        if duel_results.get_winner() or len(winners) != 1:
+            continue
+        cycles += 1
+        result = calculate_cpo_stv(
+            candidates,
+            ballots,
+            seats,
+            allow_random=False,
+            tiebreak="ranked_pairs",
+            prune_hopeless=True,
+        )
+        assert result.elected_as_set() == set(winners[0])
+        poll = CPO_STV(
+            seats=seats, candidates=candidates, tiebreak=CPOTiebreak.RankedPairs
+        )
+        for ballot in ballots:
+            poll.add_ballot(*ballot)
+        poll_result = poll.calculate()
+        assert poll_result.complete and not poll_result.randomized
+    assert cycles
+
+    with pytest.raises(ValueError):
+        calculate_cpo_stv(candidates, ballots, seats, tiebreak="borda")
+
+
+def test_cpo_limits():
+    from math import comb
+    from random import Random
+
+    from stvpoll.cpo_stv import CPO_STV, CPOLimits, calculate_cpo_stv, estimate_cpo_cost
+    from stvpoll.exceptions import CPOLimitExceeded
+    from stvpoll.scottish_stv import calculate_scottish_stv
+
+    estimate = estimate_cpo_cost(12, 4, 300, 1500, required=1)
+    assert estimate.outcomes == comb(11, 3)
+    assert estimate.duels == comb(estimate.outcomes, 2)
+    parallel = estimate_cpo_cost(12, 4, 300, 1500, required=1, processes=4)
+    assert parallel.seconds < estimate.seconds
+
+    rnd = Random(24)
+    candidates = tuple("abcdefgh")
+    ballots = [
+        (rnd.sample(candidates, rnd.randint(1, 8)), rnd.randint(1, 3))
+        for _ in range(50)
+    ] + [((), 2)]
+    # Within limits, counts are as without them
+    seed(3)
+    expected = calculate_cpo_stv(candidates, ballots, 3)
+    seed(3)
+    assert (
+        calculate_cpo_stv(
+            candidates, ballots, 3, limits=CPOLimits(outcomes=56, seconds=60)
+        )
+        == expected
+    )
+
+    limits = CPOLimits(duels=100)
+    with pytest.raises(CPOLimitExceeded) as exceeded:
+        calculate_cpo_stv(candidates, ballots, 3, limits=limits)
+    assert exceeded.value.estimate.duels == comb(56, 2)
+    poll = CPO_STV(seats=3, candidates=candidates, limits=limits)
+    for ballot in ballots:
+        poll.add_ballot(*ballot)
+    with pytest.raises(CPOLimitExceeded):
+        poll.calculate()
+
+    # Fallback counts with Scottish STV, recorded in the result
+    limits = CPOLimits(duels=100, fallback=True)
+    seed(3)
+    expected = calculate_scottish_stv(candidates, ballots, 3)
+    seed(3)
+    result = calculate_cpo_stv(candidates, ballots, 3, limits=limits)
+    assert result == expected
+    assert [r.votes for r in result.rounds] == [r.votes for r in expected.rounds]
+    assert result.empty_ballot_count == 2
+    fallback = result.as_dict()["cpo_fallback"]
+    assert fallback["method"] == "Scottish STV"
+    assert fallback["estimate"]["duels"] == comb(56, 2)
+    assert "duels 1540 > 100" in fallback["reason"]
+
+    poll = CPO_STV(seats=3, candidates=candidates, limits=limits)
+    for ballot in ballots:
+        poll.add_ballot(*ballot)
+    result = poll.calculate()
+    assert result.complete
+    assert result.empty_ballot_count == 2
+    assert result.result_extra["cpo_fallback"]["method"] == "Scottish STV"
+
+
+def test_cpo_fallback_options():
+    from random import Random
+
+    from stvpoll.arithmetic import FixedPoint
+    from stvpoll.cpo_stv import CPO_STV, CPOLimits, calculate_cpo_stv
+    from stvpoll.scottish_stv import calculate_scottish_stv
+
+    rnd = Random(24)
+    candidates = tuple("abcdefgh")
+    ballots = [
+        (rnd.sample(candidates, rnd.randint(1, 8)), rnd.randint(1, 3))
+        for _ in range(50)
+    ] + [(("a",), 20)]
+    options = {"arithmetic": FixedPoint(), "compact_ballots": True}
+    seed(3)
+    expected = calculate_cpo_stv(candidates, ballots, 3)
+    seed(3)
+    assert calculate_cpo_stv(candidates, ballots, 3, **options) == expected
+    pruning = expected.result_extra["outcome_pruning"]
+    assert pruning["required"] == ("a",)
+
+    # Fallback counts with the same options, keeping outcome pruning
+    limits = CPOLimits(duels=100, fallback=True)
+    seed(3)
+    expected = calculate_scottish_stv(candidates, ballots, 3, **options)
+    seed(3)
+    result = calculate_cpo_stv(candidates, ballots, 3, limits=limits, **options)
+    assert result == expected
+    assert result.transfer_log == expected.transfer_log
+    assert result.result_extra["outcome_pruning"] == pruning
+    assert "duels 210 > 100" in result.result_extra["cpo_fallback"]["reason"]
+
+    poll = CPO_STV(
+        seats=3, candidates=candidates, limits=limits, merge_interval=1, **options
+    )
+    for ballot in ballots:
+        poll.add_ballot(*ballot)
+    result = poll.calculate()
+    assert result.elected_as_set() == expected.elected_as_set()
+    assert result.result_extra["outcome_pruning"] == pruning
+    assert result.result_extra["ballot_merges"]
+    assert "cpo_fallback" in result.result_extra
+
+
+def test_duel_margins():
+    from array import array
+    from decimal import Decimal
+    from itertools import combinations
+    from random import Random
+
+    from stvpoll.cpo_stv import DuelResults
+    from stvpoll.types import Duel
+
+    rnd = Random(25)
+    outcomes = tuple((i,) for i in range(12))
+    margins = {}
+    results = DuelResults(outcomes, keep_margins=True)
+    for first, second in combinations(range(len(outcomes)), 2):
+        margin = Decimal(rnd.randint(-20, 20)).scaleb(-rnd.randint(0, 5))
+        margins[first, second] = margin
+        winner, loser = (first, second) if margin > 0 else (second, first)
+        results.add(Duel(outcomes[winner], outcomes[loser], abs(margin)))
+    assert isinstance(results.margins, array)
+    assert len(results.margins) == len(margins)
+    for (first, second), margin in margins.items():
+        assert results.get_margin(first, second) == margin
+        assert results.get_margin(second, first) == -margin
+    # Records of minimax and the Smith set agree with the margins
+    for outcome in range(len(outcomes)):
+        others = [i for i in range(len(outcomes)) if i != outcome]
+        defeats = [results.get_margin(i, outcome) for i in others]
+        assert results.largest_defeat[outcome] == max(0, *defeats)
+        assert list(results.iter_beaten_by(outcome)) == [
+            i for i in others if results.get_margin(i, outcome) >= 0
+        ]
+
+    # Margins finer than the default rounding are kept as Decimal
+    fine = DuelResults(outcomes[:3], keep_margins=True)
+    fine.add(Duel(outcomes[0], outcomes[1], Decimal("0.5")))
+    fine.add(Duel(outcomes[2], outcomes[0], Decimal("0.000001")))
+    fine.add(Duel(outcomes[1], outcomes[2], Decimal(2)))
+    assert fine.margins == [Decimal("0.5"), Decimal("-0.000001"), Decimal(2)]
+    assert fine.resolve_tie_ranked_pairs(False, None) == outcomes[0]
+
+
+def test_moved_types():
+    from stvpoll import cpo_stv, types
+
+    assert (cpo_stv.Duel, cpo_stv.Duels) == (types.Duel, types.Duels)
+
+
+def test_deprecated_duel_functions():
+    from decimal import Decimal
+
+    from stvpoll.cpo_stv import Duel, get_duels_winner, resolve_tie_minimax
+
+    duels = (
+        Duel(("B",), ("A",), Decimal(2)),
+        Duel(("A",), ("C",), Decimal(3)),
+        Duel(("C",), ("B",), Decimal(1)),
+    )
+    with pytest.deprecated_call():
+        assert get_duels_winner(duels) is None
+    with pytest.deprecated_call():
+        assert resolve_tie_minimax(duels, False, None) == ("B",)
+    with pytest.deprecated_call():
+        assert get_duels_winner(duels[:2] + (Duel(("B",), ("C",), Decimal(1)),)) == (
+            "B",
+        )
+
+
+def test_outcomes_duel_preference_ballots():
+    from stvpoll.ballots import PreferenceBallot
+    from stvpoll.cpo_stv import DuelBallots, iter_candidate_ballots, outcomes_duel
+    from stvpoll.store import BallotProfile
+
+    ballots = (
+        (("Andrea", "Batman"), 9),
+        (("Andrea", "Robin"), 4),
+        (("Batman",), 5),
+        (("Robin", "Gorm"), 6),
+        (("Gorm",), 3),
+    )
+    profile = BallotProfile(("Andrea", "Batman", "Robin", "Gorm"))
+    for ballot in ballots:
+        profile.add(*ballot)
+    preference_ballots = tuple(PreferenceBallot(*ballot) for ballot in ballots)
+    for compared in (
+        (("Andrea", "Batman"), ("Andrea", "Robin")),
+        (("Batman", "Gorm"), ("Andrea", "Robin")),
+    ):
+        duel = outcomes_duel(preference_ballots, compared, 10)
+        assert duel == outcomes_duel(DuelBallots(profile), compared, 10)
+    # Ballots are copied, not counted in place
+    assert [b.multiplier for b in preference_ballots] == [1] * 5
+    with pytest.deprecated_call():
+        assert list(
+            iter_candidate_ballots(preference_ballots, "Robin", {"Robin", "Gorm"})
+        ) == [preference_ballots[1], preference_ballots[3]]
@@ -27,6 +27,76 @@ def test_irv():
     assert not result.randomized
 
 
+def test_irv_bulk_exclusion():
+    import random
+
+    from stvpoll.irv import IRV, calculate_irv
+    from stvpoll.types import SelectionMethod
+
+    def count(candidates, ballots):
+        random.seed(1)
+        poll = IRV(candidates=candidates, bulk_exclusion=True)
+        for ballot in ballots:
+            poll.add_ballot(*ballot)
+        return (
+            poll.calculate(),
+            calculate_irv(candidates, ballots, bulk_exclusion=True),
+        )
+
+    # Votes of Eric, Don and Chris could give Alice majority, so one at a time
+    poll = mk_opa_example_poll(IRV)
+    poll.bulk_exclusion = True
+    result = poll.calculate()
+    assert [r.selected for r in result.rounds] == [
+        ("Eric",),
+        ("Don",),
+        ("Chris",),
+        ("Bob",),
+        ("Alice",),
+    ]
+    assert SelectionMethod.BulkExclusion not in {
+        r.selection_method for r in result.rounds
+    }
+
+    candidates = ("Alice", "Bob", "Chris", "Don", "Eric", "Fay")
+    ballots = (
+        (("Alice", "Bob"), 20),
+        (("Bob",), 18),
+        (("Chris", "Bob"), 14),
+        (("Don", "Chris"), 3),
+        (("Eric", "Don"), 2),
+        (("Fay", "Alice"), 1),
+    )
+    # The IRV class also logs initial votes
+    for result, transfers in zip(count(candidates, ballots), (3, 2)):
+        assert result.elected_as_tuple() == ("Bob",)
+        assert [(r.selected, r.selection_method) for r in result.rounds] == [
+            (("Fay",), SelectionMethod.BulkExclusion),
+            (("Eric",), SelectionMethod.BulkExclusion),
+            (("Don",), SelectionMethod.BulkExclusion),
+            (("Chris",), SelectionMethod.Direct),
+            (("Bob",), SelectionMethod.Direct),
+        ]
+        # Trailing candidates in one transfer, then Chris. Votes of the winner stay.
+        assert len(result.transfer_log) == transfers
+        assert result.rounds[-1].votes == {"Alice": 21, "Bob": 32}
+        assert not result.randomized
+
+    # Excluding Eric gives Alice majority, so the count stops there
+    ballots = (
+        (("Alice",), 30),
+        (("Bob",), 20),
+        (("Chris", "Alice"), 6),
+        (("Don", "Bob"), 4),
+        (("Eric", "Alice"), 3),
+    )
+    for result in count(candidates[:5], ballots):
+        assert [(r.selected, r.selection_method) for r in result.rounds] == [
+            (("Eric",), SelectionMethod.Direct),
+            (("Alice",), SelectionMethod.Direct),
+        ]
+
+
 def test_stv():
     from stvpoll.scottish_stv import ScottishSTV
 
@@ -0,0 +1,104 @@
+def test_ballot_trie_entries():
+    from decimal import Decimal
+
+    from stvpoll.arithmetic import FixedPoint
+    from stvpoll.piles import BallotTrie
+
+    arithmetic = FixedPoint(index=BallotTrie)
+    ballots = [
+        arithmetic.ballot(preferences, count)
+        for preferences, count in (
+            ("ABC", 2),
+            ("ABD", 1),
+            ("ADC", 3),
+            ("B", 4),
+            ("CB", 1),
+            ("A", 2),
+        )
+    ]
+    piles = arithmetic.piles(ballots, "ACD")
+    # All ballots starting with A are one entry, and B alone is not standing
+    assert [(list(b), b.count) for b in piles["A"]] == [(["A"], 8)]
+    assert [(list(b), b.count) for b in piles["C"]] == [(["C"], 1)]
+    assert piles.get_votes("ACD") == {"A": 8, "C": 1, "D": 0}
+    # Transfers split the entry by next standing candidate, splicing out B
+    transfers = [(list(b), b.count) for b, _ in piles.pop_transfers(("A",))]
+    assert transfers == [
+        (["A"], 2),
+        (["A", "B", "C"], 2),
+        (["A", "B", "D"], 1),
+        (["A", "D"], 3),
+    ]
+    assert all(b.multiplier == Decimal(1) for b, _ in piles.pop_transfers(("C",)))
+
+
+def test_ballot_trie_polls(compare_polls):
+    from stvpoll.arithmetic import DecimalArithmetic, FixedPoint
+    from stvpoll.piles import BallotTrie
+
+    def ballots(rnd, candidates):
+        # Short ballots over few candidates, to share leading preferences
+        return [
+            (rnd.sample(candidates[:5], rnd.randint(1, 3)), rnd.randint(1, 9))
+            for _ in range(40)
+        ] + [(rnd.sample(candidates, rnd.randint(1, 8)), 1) for _ in range(20)]
+
+    compare_polls(
+        11,
+        [
+            ({}, {"arithmetic": DecimalArithmetic(index=BallotTrie)}),
+            ({}, {"arithmetic": FixedPoint(index=BallotTrie)}),
+        ],
+        ballots=ballots,
+    )
+
+
+def test_merge_ballots_polls(compare_polls):
+    from stvpoll.arithmetic import FixedPoint
+
+    compared = compare_polls(
+        13,
+        [
+            ({}, {"merge_interval": 1}),
+            ({}, {"merge_interval": 2, "arithmetic": FixedPoint()}),
+        ],
+        candidates=tuple("abcdefghij"),
+        ballot_count=80,
+        seats=4,
+    )
+    for result, _ in compared:
+        merges = result.result_extra.get("ballot_merges", ())
+        assert all(m["merged"] <= m["ballots"] for m in merges)
+
+
+def test_merge_ballot_counts():
+    from stvpoll.scottish_stv import calculate_scottish_stv
+
+    candidates = ("Andrea", "Batman", "Robin", "Gorm")
+    ballots = [
+        (("Andrea", "Batman"), 5),
+        (("Andrea", "Robin", "Batman"), 3),
+        (("Robin", "Batman"), 2),
+        (("Gorm", "Batman"), 1),
+        (("Gorm", "Andrea"), 2),
+        (("Batman",), 4),
+        (("Robin", "Andrea"), 1),
+    ]
+    expected = calculate_scottish_stv(candidates, ballots, 2, random_shuffle=False)
+    assert "ballot_merges" not in expected.result_extra
+    result = calculate_scottish_stv(
+        candidates, ballots, 2, random_shuffle=False, merge_interval=1
+    )
+    assert result.elected_as_tuple() == expected.elected_as_tuple()
+    assert [r.votes for r in result.rounds] == [r.votes for r in expected.rounds]
+    assert result.result_extra["ballot_merges"] == [
+        {"round": 1, "ballots": 7, "merged": 7},
+        {"round": 2, "ballots": 6, "merged": 5},
+        {"round": 3, "ballots": 4, "merged": 2},
+    ]
+    result = calculate_scottish_stv(
+        candidates, ballots, 2, random_shuffle=False, merge_interval=2
+    )
+    assert result.result_extra["ballot_merges"] == [
+        {"round": 2, "ballots": 6, "merged": 5}
+    ]
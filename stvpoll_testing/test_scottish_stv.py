@@ -161,3 +161,46 @@ def test_vote_transfers():
     result = poll.calculate()
     assert poll.quota == 3
     assert result.rounds[1].votes[6038] == Decimal(2.5)
+
+
+def test_bulk_exclusion():
+    from stvpoll.scottish_stv import ScottishSTV, calculate_scottish_stv
+    from stvpoll.types import CandidateStatus, SelectionMethod
+
+    with open("stvpoll_testing/70 in 35.json") as infile:
+        vote_data = json.load(infile)
+    candidates = vote_data["candidates"][:70]
+    ballots = [(v, 1) for v in vote_data["ballots"]]
+    for seats in (5, 15):
+        result = calculate_scottish_stv(
+            candidates, ballots, seats, random_shuffle=False
+        )
+        bulk_result = calculate_scottish_stv(
+            candidates, ballots, seats, random_shuffle=False, bulk_exclusion=True
+        )
+        assert bulk_result == result
+        assert bulk_result.exhausted == result.exhausted
+        assert bulk_result.rounds[-1].votes == result.rounds[-1].votes
+        # Each candidate is still recorded as excluded in a round of its own
+        assert len(bulk_result.rounds) == len(result.rounds)
+        bulk_rounds = [
+            r
+            for r in bulk_result.rounds
+            if r.selection_method == SelectionMethod.BulkExclusion
+        ]
+        assert bulk_rounds
+        assert all(
+            r.status == CandidateStatus.Excluded and len(r.selected) == 1
+            for r in bulk_rounds
+        )
+        assert len(bulk_result.transfer_log) < len(result.transfer_log)
+
+        results = []
+        for bulk_exclusion in (False, True):
+            seed(seats)
+            poll = ScottishSTV(seats, candidates, bulk_exclusion=bulk_exclusion)
+            for b in vote_data["ballots"]:
+                poll.add_ballot(b)
+            results.append(poll.calculate())
+        assert results[1] == results[0]
+        assert results[1].exhausted == results[0].exhausted
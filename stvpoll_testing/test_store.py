@@ -0,0 +1,198 @@
+import random
+from decimal import Decimal
+from random import Random
+
+import pytest
+
+
+def test_stored_ballot_api():
+    from stvpoll.arithmetic import DecimalArithmetic, FixedPoint
+    from stvpoll.exceptions import STVException
+    from stvpoll.store import BallotStore
+
+    for arithmetic in (DecimalArithmetic(), FixedPoint()):
+        store = BallotStore("ABCD", arithmetic)
+        store.add("CA", 3)
+        store.add("D", 1)
+        with pytest.raises(STVException):
+            store.add("AX", 1)
+        assert len(store) == 2
+        assert len(store.preferences) == 3
+        ballot = store[0]
+        reference = arithmetic.ballot("CA", 3)
+        assert list(ballot) == list(reference)
+        assert (len(ballot), ballot[1], store[-1][0]) == (2, "A", "D")
+        assert ballot.get_next_preference("AB") == "A"
+        assert ballot.advance("AB") == "A"
+        # Views share state through the store
+        assert store[0].position == 1
+        transfer_quota = arithmetic.get_transfer_quota(Decimal(7), 4)
+        ballot.decrease_value(transfer_quota)
+        reference.decrease_value(transfer_quota)
+        assert store[0].value == reference.value
+        assert store[0].multiplier == reference.multiplier
+        assert store[0].weight == reference.weight
+
+
+def test_compact_ballot_columns():
+    from array import array
+
+    from stvpoll.arithmetic import FixedPoint
+    from stvpoll.base import get_ballots
+    from stvpoll.scottish_stv import calculate_scottish_stv
+
+    candidates = ("Andrea", "Batman", "Robin", "Gorm")
+    ballots = [
+        (("Andrea", "Batman"), 9),
+        (("Andrea", "Robin"), 4),
+        ((), 2),
+        (("Batman",), 5),
+        (("Robin", "Gorm"), 6),
+        (("Gorm",), 3),
+    ]
+    empty, store = get_ballots(ballots, candidates, FixedPoint(), compact=True)
+    # One flat array of candidate indexes, sliced by offsets, and a column per field
+    assert empty == 2
+    assert store.preferences == array("i", [0, 1, 0, 2, 1, 2, 3, 3])
+    assert store.offsets == array("q", [0, 2, 4, 5, 7, 8])
+    assert store.counts == array("q", [9, 4, 5, 6, 3])
+    assert store.multipliers == array("q", [100000] * 5)
+    assert store.positions == array("i", [0] * 5)
+
+    expected = calculate_scottish_stv(candidates, ballots, 2, random_shuffle=False)
+    for arithmetic in (None, FixedPoint()):
+        result = calculate_scottish_stv(
+            candidates,
+            ballots,
+            2,
+            random_shuffle=False,
+            arithmetic=arithmetic,
+            compact_ballots=True,
+        )
+        assert result.elected_as_tuple() == ("Andrea", "Batman")
+        assert result == expected
+        assert result.empty_ballot_count == 2
+        assert str(result.exhausted) == str(expected.exhausted)
+        assert [r.votes for r in result.rounds] == [r.votes for r in expected.rounds]
+        assert result.transfer_log == expected.transfer_log
+
+
+def test_compact_ballot_polls(compare_polls):
+    from stvpoll.arithmetic import FixedPoint
+
+    compared = compare_polls(
+        17,
+        [
+            (
+                {"arithmetic": arithmetic},
+                {"arithmetic": arithmetic, "compact_ballots": True},
+            )
+            for arithmetic in (None, FixedPoint())
+        ],
+        extra_ballots=(((), 2),),
+    )
+    assert all(result.empty_ballot_count == 2 for result, _ in compared)
+
+
+def test_shared_profile():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from stvpoll.arithmetic import FixedPoint
+    from stvpoll.exceptions import STVException
+    from stvpoll.irv import calculate_irv
+    from stvpoll.scottish_stv import ScottishSTV, calculate_scottish_stv
+    from stvpoll.store import BallotProfile
+
+    rnd = Random(19)
+    candidates = tuple("abcdefgh")
+    ballots = [
+        (rnd.sample(candidates, rnd.randint(0, 8)), rnd.randint(1, 9))
+        for _ in range(200)
+    ]
+    profile = BallotProfile(candidates)
+    for ballot in ballots:
+        profile.add(*ballot)
+    arrays = (profile.preferences.tobytes(), profile.counts.tobytes())
+
+    counts = [
+        (seats, arithmetic)
+        for seats in range(1, 6)
+        for arithmetic in (None, FixedPoint())
+    ]
+
+    def count(ballot_data, seats, arithmetic):
+        return calculate_scottish_stv(
+            candidates,
+            ballot_data,
+            seats,
+            random_shuffle=False,
+            arithmetic=arithmetic,
+        )
+
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda c: count(profile, *c), counts))
+    for (seats, arithmetic), result in zip(counts, results):
+        expected = count(ballots, seats, arithmetic)
+        assert result == expected
+        assert result.empty_ballot_count == expected.empty_ballot_count
+        assert [r.votes for r in result.rounds] == [r.votes for r in expected.rounds]
+    assert calculate_irv(candidates, profile, random_shuffle=False) == calculate_irv(
+        candidates, ballots, random_shuffle=False
+    )
+    assert (profile.preferences.tobytes(), profile.counts.tobytes()) == arrays
+
+    # Poll classes count a profile with weights of their own
+    polls = []
+    for seats in (2, 2, 3):
+        random.seed(seats)
+        poll = ScottishSTV(seats, candidates)
+        poll.load_profile(profile)
+        polls.append(poll)
+    results = [poll.calculate() for poll in polls]
+    assert results[0] == results[1]
+    assert [r.votes for r in results[0].rounds] == [r.votes for r in results[1].rounds]
+    assert results[0].empty_ballot_count == profile.empty_ballot_count
+    assert all(m == 1 for m in polls[0].ballots.multipliers)
+
+    with pytest.raises(STVException):
+        calculate_irv(candidates[::-1], profile)
+
+
+def test_shared_profile_memory():
+    from stvpoll.scottish_stv import calculate_scottish_stv
+    from stvpoll.store import BallotProfile
+
+    candidates = ("Andrea", "Batman", "Robin", "Gorm")
+    ballots = [
+        (("Andrea", "Batman"), 9),
+        (("Andrea", "Robin"), 4),
+        (("Batman",), 5),
+        (("Robin", "Gorm"), 6),
+        (("Gorm",), 3),
+    ]
+    profile = BallotProfile(candidates)
+    for ballot in ballots:
+        profile.add(*ballot)
+    memory = profile.share()
+    try:
+        shared = BallotProfile.attach(candidates, memory.name, len(profile))
+        # Attached arrays read the block in place
+        assert (
+            list(shared.offsets),
+            list(shared.counts),
+            list(shared.preferences),
+        ) == (list(profile.offsets), list(profile.counts), list(profile.preferences))
+        memory.buf[profile.offsets.itemsize * len(profile.offsets)] = 7
+        assert shared.counts[0] == 7
+        memory.buf[profile.offsets.itemsize * len(profile.offsets)] = 9
+        assert calculate_scottish_stv(
+            candidates, shared, 2, random_shuffle=False
+        ) == calculate_scottish_stv(candidates, ballots, 2, random_shuffle=False)
+        shared.release()
+        with pytest.raises(ValueError):
+            shared.counts[0]
+    finally:
+        memory.close()
+        memory.unlink()
+    with pytest.raises(FileNotFoundError):
+        BallotProfile.attach(candidates, memory.name, len(profile))
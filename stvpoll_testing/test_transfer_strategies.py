@@ -67,3 +67,134 @@ def test_transfer_serial():
     assert ballots[1].multiplier == Decimal("0.545"), "(4.4-2)/4.4 = 0.545"
     assert ballots[0].multiplier == Decimal("0.327"), "0.6*0.54545 = 0.327"
     assert votes == {3: Decimal("3.398")}
+
+
+def test_transfer_serial_queue_order():
+    """Ballot cursors must not skip candidates later in the transfer queue"""
+    from stvpoll.transfer_strategies import transfer_serial
+    from stvpoll.abcs import PreferenceBallot
+
+    ballots = [
+        PreferenceBallot(("X", "Y", "Z"), 6),
+        PreferenceBallot(("Y", "X", "Z"), 5),
+    ]
+    transfers, exhausted, votes = transfer_serial(
+        ballots=ballots,
+        vote_count={"X": Decimal(6), "Y": Decimal(5), "Z": Decimal(0)},
+        transfers=("X", "Y"),
+        standing=("Z",),
+        quota=4,
+        decrease_value=True,
+    )
+    assert transfers == {
+        ("X", "Y"): Decimal("3.66663"),
+        ("Y", "Z"): Decimal("1.97428"),
+    }
+    assert exhausted == 0
+    assert votes == {"Z": Decimal("1.97428")}
+
+
+def test_transfer_serial_several_elected():
+    """Each candidate transfers ballots where it comes before standing candidates"""
+    from stvpoll.transfer_strategies import transfer_serial
+    from stvpoll.abcs import PreferenceBallot
+    from stvpoll.arithmetic import DecimalArithmetic
+    from stvpoll.piles import BallotPiles
+
+    for index in (None, BallotPiles):
+        ballots = [
+            PreferenceBallot(("A", "B", "Z"), 6),
+            PreferenceBallot(("C", "B", "A", "W"), 4),
+            PreferenceBallot(("B", "Z"), 5),
+            PreferenceBallot(("Z", "A"), 2),
+        ]
+        vote_count = {"A": 6, "B": 5, "C": 4, "Z": 2, "W": 0}
+        transfers, exhausted, votes = transfer_serial(
+            ballots=index(ballots, vote_count, DecimalArithmetic())
+            if index
+            else ballots,
+            vote_count={c: Decimal(v) for c, v in vote_count.items()},
+            transfers=("A", "B", "C"),
+            standing=("Z", "W"),
+            quota=3,
+            decrease_value=True,
+        )
+        assert transfers == {
+            ("A", "B"): Decimal(3),
+            ("A", "C"): Decimal(2),
+            ("B", "Z"): Decimal(5),
+            ("B", "C"): Decimal("1.25"),
+            ("C", "W"): Decimal("0.73276"),
+        }
+        assert exhausted == 0
+        assert votes == {"Z": Decimal(7), "W": Decimal("0.73276")}
+        # Second ballot was transferred by all three, to C, C and W
+        assert [b.multiplier for b in ballots] == [
+            Decimal("0.3125"),
+            Decimal("0.18319"),
+            Decimal("0.625"),
+            Decimal(1),
+        ]
+
+
+def test_transfer_piles():
+    from stvpoll.transfer_strategies import transfer_all, transfer_serial
+    from stvpoll.abcs import PreferenceBallot
+    from stvpoll.arithmetic import DecimalArithmetic
+    from stvpoll.piles import BallotPiles
+
+    for strategy in (transfer_all, transfer_serial):
+        ballots = [
+            PreferenceBallot((1, 2, 3), 4),
+            PreferenceBallot((2, 3), 2),
+            PreferenceBallot((3,), 1),
+            PreferenceBallot((1,), 1),
+        ]
+        piles = BallotPiles(ballots, (1, 2, 3), DecimalArithmetic())
+        transfers, exhausted, votes = strategy(
+            ballots=piles,
+            vote_count=piles.get_votes((1, 2, 3)),
+            transfers=(1,),
+            standing=(2, 3),
+            quota=2,
+            decrease_value=False,
+        )
+        assert transfers == {(1, 2): Decimal(4)}
+        assert exhausted == Decimal(1)
+        assert votes == {2: Decimal(6), 3: Decimal(1)}
+        assert 1 not in piles
+        assert piles[2] == [ballots[1], ballots[0]]
+        assert piles.get_votes((1, 2, 3)) == votes
+        assert sorted(map(id, piles)) == sorted(map(id, ballots[:3])), "Not exhausted"
+
+
+def test_transfer_trie_queue_order():
+    """Aggregated ballots must transfer as the ballots in them would"""
+    from stvpoll.arithmetic import DecimalArithmetic
+    from stvpoll.piles import BallotTrie
+    from stvpoll.transfer_strategies import transfer_serial
+
+    arithmetic = DecimalArithmetic(index=BallotTrie)
+    ballots = [
+        arithmetic.ballot(("X", "Y", "Z"), 4),
+        arithmetic.ballot(("X", "Y"), 2),
+        arithmetic.ballot(("Y", "X", "Z"), 3),
+        arithmetic.ballot(("Y", "X"), 2),
+    ]
+    piles = arithmetic.piles(ballots, ("X", "Y", "Z"))
+    assert len(list(piles)) == 2
+    transfers, exhausted, votes = transfer_serial(
+        ballots=piles,
+        vote_count=piles.get_votes(("X", "Y", "Z")),
+        transfers=("X", "Y"),
+        standing=("Z",),
+        quota=4,
+        decrease_value=True,
+    )
+    assert transfers == {
+        ("X", "Y"): Decimal("3.66663"),
+        ("Y", "Z"): Decimal("1.25636"),
+    }
+    assert exhausted == Decimal("0.71792")
+    assert votes == {"Z": Decimal("1.25636")}
+    assert piles.get_votes(("Z",)) == piles.recount(("Z",)) == votes
@@ -0,0 +1,269 @@
+from decimal import Decimal, localcontext
+import random
+from random import Random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+
+def test_rank_matrix_transfer():
+    from stvpoll.transfer_strategies import transfer_all, transfer_serial
+    from stvpoll.vectorized import VectorizedFixedPoint
+
+    arithmetic = VectorizedFixedPoint()
+    for strategy in (transfer_all, transfer_serial):
+        ballots = [
+            arithmetic.ballot((1, 2, 3), 4),
+            arithmetic.ballot((2, 3), 2),
+            arithmetic.ballot((3,), 1),
+            arithmetic.ballot((1,), 1),
+        ]
+        matrix = arithmetic.piles(ballots, (1, 2, 3))
+        transfers, exhausted, votes = strategy(
+            ballots=matrix,
+            vote_count=matrix.get_votes((1, 2, 3)),
+            transfers=(1,),
+            standing=(2, 3),
+            quota=2,
+            decrease_value=True,
+        )
+        assert transfers == {(1, 2): Decimal("2.4")}
+        assert exhausted == Decimal("0.6")
+        assert votes == {2: Decimal("4.4"), 3: Decimal(1)}
+        assert 1 not in matrix
+        assert matrix.get_votes((1, 2, 3)) == votes
+        assert matrix.recount((1, 2, 3)) == votes
+
+
+def test_rank_matrix_shapes():
+    from stvpoll.transfer_strategies import transfer_serial
+    from stvpoll.vectorized import VectorizedFixedPoint
+
+    arithmetic = VectorizedFixedPoint()
+    ballots = [
+        arithmetic.ballot((1, 2, 3), 2),
+        arithmetic.ballot((4, 2), 1),
+        arithmetic.ballot((), 3),
+        arithmetic.ballot((3, 1, 2), 2),
+        arithmetic.ballot((1, 3, 2), 1),
+    ]
+    matrix = arithmetic.piles(ballots, (1, 2, 3))
+    # Rankings are padded with the exhausted index, 4 after standing candidates
+    assert matrix.exhausted == 4
+    assert matrix.ranks.tolist() == [
+        [0, 1, 2, 4],
+        [3, 1, 4, 4],
+        [4, 4, 4, 4],
+        [2, 0, 1, 4],
+        [0, 2, 1, 4],
+    ]
+    assert len(matrix) == 4
+    assert matrix.get_votes((1, 2, 3)) == {1: 3, 2: 1, 3: 2}
+
+    transfer_serial(
+        ballots=matrix,
+        vote_count=matrix.get_votes((1, 2, 3)),
+        transfers=(1,),
+        standing=(2, 3),
+        quota=3,
+        decrease_value=False,
+    )
+    matrix.merge()
+    # Empty ballots are dropped, and (3, 1, 2) merges with (1, 3, 2) as (3, 2)
+    assert matrix.ranks.tolist() == [[1, 2, 4], [1, 4, 4], [2, 1, 4]]
+    assert matrix.counts.tolist() == [2, 1, 3]
+    assert matrix.get_votes((2, 3)) == {2: 3, 3: 3}
+
+
+@pytest.mark.parametrize("context_precision", (28, 8))
+def test_vectorized_decrease(context_precision: int):
+    import numpy as np
+
+    from stvpoll.vectorized import VectorizedFixedPoint
+
+    rnd = Random(context_precision)
+    arithmetic = VectorizedFixedPoint()
+    matrix = arithmetic.piles([arithmetic.ballot((1,), 1)], (1,))
+    units = np.array([rnd.randint(0, arithmetic.unit) for _ in range(300)])
+    with localcontext() as context:
+        context.prec = context_precision
+        for quota, votes in ((1, Decimal(2)), (3, Decimal(7)), (2, Decimal(3))):
+            transfer_quota = arithmetic.get_transfer_quota(votes, quota)
+            assert matrix._decrease(units, votes, quota).tolist() == [
+                transfer_quota.apply(int(u)) for u in units
+            ]
+
+
+def test_vectorized_polls(compare_polls):
+    from stvpoll.vectorized import VectorizedFixedPoint
+
+    compare_polls(
+        5,
+        [
+            ({}, {"arithmetic": VectorizedFixedPoint()}),
+            ({}, {"arithmetic": VectorizedFixedPoint(), "merge_interval": 1}),
+        ],
+    )
+
+
+def test_duel_matrix():
+    from itertools import combinations
+
+    from stvpoll.cpo_stv import (
+        CPO_STV,
+        DuelBallots,
+        calculate_cpo_stv,
+        get_outcomes,
+        iter_pairwise_duels,
+        outcomes_duel,
+    )
+    from stvpoll.store import BallotProfile
+    from stvpoll.vectorized import DuelMatrix
+
+    rnd = Random(22)
+    candidates = tuple("abcdefg")
+    for _ in range(10):
+        ballots = [
+            (rnd.sample(candidates, rnd.randint(1, 7)), rnd.choice((1, 2, 3, 50)))
+            for _ in range(40)
+        ]
+        seats = rnd.randint(1, 5)
+        profile = BallotProfile(candidates)
+        for ballot in ballots:
+            profile.add(*ballot)
+        quota = sum(profile.counts) // (seats + 1) + 1
+        compared = list(combinations(get_outcomes(candidates, seats), 2))
+        duel_ballots = DuelBallots(profile)
+        expected = [outcomes_duel(duel_ballots, pair, quota) for pair in compared]
+        # Batches of any size count the same duels
+        for batch_size in (1, 100, 1 << 22):
+            matrix = DuelMatrix(profile, batch_size=batch_size)
+            assert list(matrix.duels(compared, quota)) == expected
+
+        random.seed(seats)
+        result = calculate_cpo_stv(candidates, ballots, seats, condorcet_search=False)
+        random.seed(seats)
+        assert (
+            calculate_cpo_stv(
+                candidates, ballots, seats, condorcet_search=False, vectorized=True
+            )
+            == result
+        )
+
+    outcomes = tuple(get_outcomes(candidates, seats))
+    assert tuple(
+        iter_pairwise_duels(
+            DuelBallots(profile), outcomes, quota, processes=2, vectorized=True
+        )
+    ) == tuple(iter_pairwise_duels(DuelBallots(profile), outcomes, quota))
+    # The poll shuffles candidates, and the surplus order may follow them
+    random.seed(seats)
+    poll = CPO_STV(seats=seats, candidates=candidates, vectorized=True)
+    for ballot in ballots:
+        poll.add_ballot(*ballot)
+    assert (
+        poll.calculate().elected_as_set()
+        == calculate_cpo_stv(poll.candidates, ballots, seats).elected_as_set()
+    )
+    # Duels rounding to other precisions are the same too
+    duel_ballots = DuelBallots(profile, precision=3)
+    assert list(duel_ballots.vectorize().duels(compared, quota)) == [
+        outcomes_duel(duel_ballots, pair, quota) for pair in compared
+    ]
+
+
+def test_duel_matrix_batches():
+    from decimal import Decimal
+
+    from stvpoll.cpo_stv import DuelBallots, outcomes_duel
+    from stvpoll.store import BallotProfile
+    from stvpoll.vectorized import DuelMatrix
+
+    profile = BallotProfile(("Andrea", "Batman", "Robin", "Gorm"))
+    for ballot in (
+        (("Andrea", "Batman"), 9),
+        (("Andrea", "Robin"), 4),
+        (("Batman",), 5),
+        (("Andrea", "Batman"), 2),
+        (("Robin", "Gorm"), 6),
+        (("Gorm",), 3),
+        ((), 2),
+    ):
+        profile.add(*ballot)
+    matrix = DuelMatrix(profile, batch_size=40)
+    # Distinct rankings, padded with the exhausted index 4
+    assert matrix.ranks.tolist() == [
+        [0, 1, 4],
+        [0, 2, 4],
+        [1, 4, 4],
+        [2, 3, 4],
+        [3, 4, 4],
+    ]
+    assert matrix.counts.tolist() == [11, 4, 5, 6, 3]
+    assert matrix.batch_size == 40 // matrix.ranks.size == 2
+    # Batches of pairs with none, one and two candidates in both outcomes
+    compared = [
+        (("Andrea", "Batman"), ("Robin", "Gorm")),
+        (("Andrea", "Batman"), ("Andrea", "Robin")),
+        (("Andrea", "Batman", "Robin"), ("Andrea", "Batman", "Gorm")),
+    ]
+    duels = list(matrix.duels(compared, 10))
+    assert [d.difference for d in duels] == [
+        Decimal("11"),
+        Decimal("1.33331"),
+        Decimal("4.33332"),
+    ]
+    ballots = DuelBallots(profile)
+    assert duels == [outcomes_duel(ballots, pair, 10) for pair in compared]
+
+
+def test_duel_matrix_empty_ballots():
+    from itertools import combinations
+
+    from stvpoll.cpo_stv import (
+        CPO_STV,
+        DuelBallots,
+        calculate_cpo_stv,
+        get_outcomes,
+        outcomes_duel,
+    )
+    from stvpoll.store import BallotProfile
+    from stvpoll.vectorized import DuelMatrix
+
+    candidates = ("C0", "C1", "C2")
+    profile = BallotProfile(candidates)
+    profile.add((), 23)
+    compared = list(combinations(get_outcomes(candidates, 2), 2))
+    assert list(DuelMatrix(profile).duels(compared, 8)) == [
+        outcomes_duel(DuelBallots(profile), pair, 8) for pair in compared
+    ]
+
+    random.seed(2)
+    expected = calculate_cpo_stv(candidates, [((), 23)], 2)
+    random.seed(2)
+    result = calculate_cpo_stv(candidates, [((), 23)], 2, vectorized=True)
+    assert result == expected
+    assert result.randomized
+    assert result.empty_ballot_count == 23
+    poll = CPO_STV(seats=2, candidates=candidates, vectorized=True)
+    poll.add_ballot((), 23)
+    assert len(poll.calculate().elected_as_tuple()) == 2
+
+
+def test_numpy_imported_on_use():
+    import subprocess
+    import sys
+
+    code = (
+        "import sys\n"
+        "from stvpoll.cpo_stv import calculate_cpo_stv\n"
+        "from stvpoll.scottish_stv import calculate_scottish_stv\n"
+        "calculate_scottish_stv('AB', [('AB', 2), ('B', 1)], 1)\n"
+        "calculate_cpo_stv('ABC', [('AB', 2), ('C', 1)], 2)\n"
+        "print('numpy' in sys.modules)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, check=True, text=True
+    )
+    assert output.stdout == "False\n"